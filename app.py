@@ -1,8 +1,8 @@
 from shiny import App, ui, render, reactive
 import pandas as pd
 import numpy as np
+from itables import JavascriptFunction
 from itables.shiny import DT
-import matplotlib.pyplot as plt
 import gc  # For garbage collection
 import folium
 from folium import plugins
@@ -10,10 +10,31 @@ import numpy as np
 import base64
 from shiny.types import NavSetArg
 from io import BytesIO
-from datetime import datetime, timedelta
+from datetime import datetime
 import string
 import math
+from urllib.parse import parse_qs
 from utility.helper import my_css, optimize_df
+from utility.comparison import compare_variables, HOUSEHOLD_KEY, CONTEXT_COLUMNS
+from utility.loader import read_excel_cached, read_excel_appended, file_hash
+from utility.registry import datasets
+from utility.schedule import build_schedule
+from utility.cleaning import (
+    group_positions, coverage_stats, prepare_cleaning_frame, append_cleaning_frame, EMPTY_COVERAGE
+)
+from utility.workspace import (
+    new_token, valid_token, load_workspace, entry_version, save_entry_later, gc_workspaces
+)
+from utility.pivot import TOTAL_LABEL, pivot_cells, pivot_frame
+from utility.cube import cube_pivot
+from utility.frequency import FrequencyService
+from utility.charts import chart_cache_key, frequency_chart
+from utility.datatable import ServerTable, table_page_response, SERVER_SIDE_MIN_ROWS
+from utility.maps import (
+    HouseholdLayer, household_features, cluster_points, CLUSTER_CALLBACK,
+    data_fingerprint, map_cache, map_cache_key, map_page_response,
+    ClusteredHouseholdLayer, get_point_index, point_query_response, RAW_POINT_LIMIT
+)
 
 
 
@@ -27,8 +48,17 @@ app_ui = ui.page_fluid(
             "Comprehensive tool for data quality assessment, monitoring, and analysis",
             class_="text-center text-muted"
         ),
+        ui.div(ui.output_text("workspace_note"), class_="text-center text-muted small"),
         class_="app-header"
     ),
+    # Keep the workspace token in the address bar so a reload reattaches to it
+    ui.tags.script("""
+        Shiny.addCustomMessageHandler('workspace_token', function(message) {
+            var url = new URL(window.location.href);
+            url.searchParams.set('workspace', message.token);
+            window.history.replaceState(null, '', url.toString());
+        });
+    """),
 
 ui.navset_tab(
 #===========================Deployement Tab=====================================
@@ -79,6 +109,16 @@ ui.navset_tab(
                     ui.h4("File Upload"),
                     ui.input_file("file1", "Upload Main Data", accept=[".xlsx", ".xls"]),
                     ui.input_file("file2", "Upload Revisit", accept=[".xlsx", ".xls"]),
+                    ui.input_select(
+                        "revisit_duplicates",
+                        "Repeated Revisit IDs",
+                        choices={
+                            "all": "Compare all pairs",
+                            "first": "Keep first revisit",
+                            "last": "Keep last revisit"
+                        },
+                        selected="all"
+                    ),
                     ui.div(
                         ui.input_select(
                             "column",
@@ -118,6 +158,7 @@ ui.navset_tab(
                 ui.sidebar(
                     ui.h4("File Upload"),
                     ui.input_file("cleaning_file", "Upload Excel File", accept=[".xlsx", ".xls"]),
+                    ui.input_checkbox("incremental_upload", "Only process new rows of a cumulative export", value=False),
                     ui.input_checkbox("show_all", "Show All Data", value=True),
                     ui.input_select(
                         "lga_filter",
@@ -131,6 +172,7 @@ ui.navset_tab(
                     ui.output_text("total_submissions"),
                     ui.output_text("valid_submissions"),
                     ui.output_text("duplicate_count"),
+                    ui.output_text("cross_lga_duplicates"),
                     class_="mb-4"
                 ),
                 ui.card(
@@ -169,9 +211,13 @@ ui.navset_tab(
                             ui.input_select(
                                 "pivot_aggfunc",
                                 "Select Aggregation",
-                                choices=["count", "sum", "mean", "min", "max"],
+                                choices={
+                                    "count": "count", "sum": "sum", "mean": "mean",
+                                    "min": "min", "max": "max", "households": "distinct households"
+                                },
                                 selected="count"
                             ),
+                            ui.input_checkbox("pivot_valid_only", "Valid interviews only", False),
                         ),
                         ui.card(
                             ui.card_header(ui.h3("Pivot Table Results")),
@@ -194,6 +240,7 @@ ui.navset_tab(
                                 choices=["Bar Chart", "Pie Chart"],
                                 selected=["Bar Chart"]
                             ),
+                            ui.input_checkbox("freq_valid_only", "Valid interviews only", False),
                         ),
                         ui.card(
                             ui.card_header("Frequency Table"),
@@ -201,7 +248,7 @@ ui.navset_tab(
                         ),
                         ui.card(
                             ui.card_header("Visualizations"),
-                            ui.output_plot("freq_plot")
+                            ui.output_ui("freq_plot")
                         )
                     )
                 ),
@@ -213,6 +260,65 @@ ui.navset_tab(
 )
 
 def server(input, output, session):
+#===========================Workspace=====================================
+    workspace = reactive.value(None)
+
+    @reactive.effect
+    @reactive.event(input[".clientdata_url_search"])
+    async def _attach_workspace():
+        """Reattach to the workspace named in the URL, or start a new one"""
+        if workspace() is not None:
+            return
+        search = parse_qs(input[".clientdata_url_search"]().lstrip('?'))
+        token = search.get('workspace', [None])[0]
+        if not valid_token(token):
+            token = new_token()
+            await session.send_custom_message('workspace_token', {'token': token})
+        workspace.set(token)
+
+        try:
+            gc_workspaces(keep=[token])
+            restored = load_workspace(token)
+        except Exception as e:
+            print(f"Error restoring workspace: {str(e)}")
+            return
+        # Restored data is held like an upload, so it counts towards the shared registry;
+        # the entry's version keeps an older copy of the same name from being reused
+        keys = {name: ('workspace', token, name, entry_version(token, name)) for name in restored}
+        restored = {
+            name: datasets.acquire(keys[name], (session.id, name), lambda value=value: value)
+            for name, value in restored.items()
+        }
+        if 'data' in restored:
+            data.set(restored['data'])
+            show_deployment_data(restored['data'])
+        if 'file1' in restored:
+            df1.set(restored['file1'])
+        if 'file2' in restored:
+            df2.set(restored['file2'])
+        if 'cleaning' in restored:
+            cleaning_data.set(restored['cleaning'])
+            cleaning_version.set(keys['cleaning'])
+            show_cleaning_state(restored['cleaning'])
+        if restored:
+            ui.notification_show("Restored your previous uploads.", type="message")
+
+    def remember(name, value):
+        """Keep an upload's processed data in the session's workspace"""
+        token = workspace()
+        if token is not None:
+            save_entry_later(token, name, value)
+
+    # Datasets shared with other sessions are released when this one ends
+    session.on_ended(lambda: datasets.release_session(session.id))
+
+    @output
+    @render.text
+    def workspace_note():
+        if workspace() is None:
+            return ""
+        return "Your uploads are kept for this page's address; bookmark it to come back to them."
+
 #===========================Deployement Tab=====================================
     data = reactive.value(None)
     lga_supervisor_mapping = reactive.value({})
@@ -222,29 +328,46 @@ def server(input, output, session):
     def _():
         if input.file() is not None:
             file_path = input.file()[0]["datapath"]
-            df = pd.read_excel(file_path)
+            # Sessions uploading the same file share one copy of it
+            df = datasets.acquire(
+                ('deployment', file_hash(file_path)),
+                (session.id, 'data'),
+                lambda: load_deployment(file_path)
+            )
             
             required_cols = ['LGA', 'Ward', 'Distribution point', 'Village', 'REVISIT STATUS']
             
             missing_cols = [col for col in required_cols if col not in df.columns]
             if missing_cols:
+                datasets.release((session.id, 'data'))
                 ui.notification_show(
                     f"Missing columns: {', '.join(missing_cols)}", 
                     type="error"
                 )
             else:
-                df['REVISIT STATUS'] = df['REVISIT STATUS'].fillna('NO').astype(str)
                 data.set(df)
-                
-                ui.update_select(
-                    "selected_lga",
-                    choices=sorted(df['LGA'].unique()),
-                    selected=None
-                )
-                
-                update_supervisor_mapping()
+                show_deployment_data(df)
+                remember('data', df)
                 ui.notification_show("Data loaded successfully!", type="message")
 
+    def load_deployment(file_path):
+        """Read a deployment workbook, treating a blank revisit status as NO"""
+        df = read_excel_cached(file_path)
+        if 'REVISIT STATUS' in df.columns:
+            df['REVISIT STATUS'] = df['REVISIT STATUS'].fillna('NO').astype(str)
+        return df
+
+    def show_deployment_data(df):
+        """Update the deployment inputs for newly loaded data"""
+        # The first LGA stays the default; "All LGAs" gives the whole-state views
+        lgas = sorted(df['LGA'].unique())
+        ui.update_select(
+            "selected_lga",
+            choices={**{lga: lga for lga in lgas}, "": "All LGAs"},
+            selected=lgas[0] if lgas else None
+        )
+        update_supervisor_mapping()
+
     @reactive.effect
     @reactive.event(input.sup_per_lga)
     def _():
@@ -331,128 +454,62 @@ def server(input, output, session):
         selected_lga = input.selected_lga()
         
         mapping = lga_supervisor_mapping()
-        daily_assignments = {}
         n_enum_per_sup = input.enum_per_sup()
         households_per_village = input.households_per_village()
         total_days = input.survey_days()
         
         start_date = datetime.now()
         
-        if selected_lga:
-            lga_data = {selected_lga: df[df['LGA'] == selected_lga]}
-        else:
-            lga_data = {lga: group for lga, group in df.groupby('LGA')}
-        
-        for lga_name, lga_group in lga_data.items():
-            supervisor_ids = mapping.get(lga_name, [])
-            if not supervisor_ids:
-                continue
-            
-            # Group by ward
-            ward_groups = dict(tuple(lga_group.groupby('Ward')))
-            
-            # Reset index for all ward groups
-            for ward in ward_groups:
-                ward_groups[ward] = ward_groups[ward].reset_index(drop=True)
-            
-            day_num = 1
-            while day_num <= total_days and any(len(group) > 0 for group in ward_groups.values()):
-                survey_date = (start_date + timedelta(days=day_num-1)).strftime('%Y-%m-%d')
-                
-                # Get available wards
-                available_wards = [ward for ward, group in ward_groups.items() if len(group) > 0]
-                if not available_wards:
-                    break
-                
-                # Assign wards and villages to supervisors
-                for sup_id in supervisor_ids:
-                    # Find a ward with at least 4 villages for this supervisor
-                    assigned_ward = None
-                    for ward in available_wards:
-                        if len(ward_groups[ward]) >= 4:
-                            assigned_ward = ward
-                            break
-                    
-                    if assigned_ward is None:
-                        continue
-                    
-                    key = (survey_date, lga_name, sup_id)
-                    if key not in daily_assignments:
-                        daily_assignments[key] = {
-                            'enumerators': [f"{sup_id}_{j+1}" for j in range(n_enum_per_sup)],
-                            'wards': set(),
-                            'villages': [],  # Changed to list to maintain order
-                            'enum_assignments': {},  # Track which enumerator gets which village
-                            'revisits': set(),
-                            'total_households': 0
-                        }
-                    
-                    # Take exactly 4 villages from the ward
-                    ward_data = ward_groups[assigned_ward]
-                    sup_villages = ward_data.iloc[:4]
-                    ward_groups[assigned_ward] = ward_data.iloc[4:]
-                    
-                    daily_assignments[key]['wards'].add(assigned_ward)
-                    
-                    # Assign each village to an enumerator
-                    for enum_idx, (_, row) in enumerate(sup_villages.iterrows()):
-                        enum_id = daily_assignments[key]['enumerators'][enum_idx]
-                        village_name = row['Village']
-                        daily_assignments[key]['villages'].append(village_name)
-                        daily_assignments[key]['enum_assignments'][village_name] = enum_id
-                        daily_assignments[key]['total_households'] += households_per_village
-                        
-                        revisit_status = str(row['REVISIT STATUS']).strip().upper()
-                        if revisit_status == 'YES':
-                            revisit_date = (start_date + timedelta(days=day_num+1)).strftime('%Y-%m-%d')
-                            daily_assignments[key]['revisits'].add(
-                                f"{village_name} (Revisit: {revisit_date})"
-                            )
-                
-                day_num += 1
-        
-        schedule_rows = []
-        for (date, lga, sup_id), details in daily_assignments.items():
-            if len(details['villages']) > 0:
-                # Create village assignments string with enumerator information
-                village_assignments = [
-                    f"{village} ({details['enum_assignments'][village]})"
-                    for village in details['villages']
-                ]
-                
-                schedule_rows.append({
-                    'Survey_Date': date,
-                    'LGA': lga,
-                    'Supervisor': sup_id,
-                    'Ward': ', '.join(sorted(details['wards'])),
-                    'Village_Assignments': ', '.join(village_assignments),
-                    'Total_Households': details['total_households'],
-                    'Revisits': ', '.join(sorted(details['revisits'])) if details['revisits'] else 'No revisits'
-                })
-        
-        if not schedule_rows:
+        schedule_df = build_schedule(
+            df, selected_lga, mapping, n_enum_per_sup,
+            households_per_village, total_days, start_date
+        )
+        if schedule_df.empty:
             return pd.DataFrame()
         
-        schedule_df = pd.DataFrame(schedule_rows)
-        schedule_df = schedule_df.sort_values(['Survey_Date', 'LGA', 'Supervisor'])
         return render.DataGrid(schedule_df)
 
+    # Rendered maps are served from this route instead of being sent over the websocket
+    map_route = session.dynamic_route("household_map", map_page_response)
+    session.dynamic_route("household_points", point_query_response)
+
+    @reactive.calc
+    def data_version():
+        return data_fingerprint(data())
+
+    def map_frame(map_key):
+        """Iframe loading a cached map page"""
+        return ui.div(
+            ui.tags.iframe(
+                src=f"{map_route}&key={map_key}",
+                style="width: 100%; height: 600px; border: none;",
+                id="map-frame"
+            )
+        )
+
     @output
     @render.ui
-    @reactive.event(input.selected_lga, input.selected_ward)
+    @reactive.event(input.selected_lga)
     def map_output():
-        if data() is None or not input.selected_lga():
-            return ui.p("Please select an LGA to view the map")
+        if data() is None:
+            return ui.p("Please upload data to view the map")
         
         try:
             df = data()
-            df = df[df['LGA'] == input.selected_lga()]
-            if input.selected_ward():
-                df = df[df['Ward'] == input.selected_ward()]
+            if input.selected_lga():
+                df = df[df['LGA'] == input.selected_lga()]
             
             if len(df) == 0:
                 return ui.p("No data available for the selected area")
             
+            # Large selections are clustered on the server and fetched per view
+            level_of_detail = len(df) > RAW_POINT_LIMIT
+            map_key = map_cache_key(data_version(), input.selected_lga())
+            if level_of_detail:
+                get_point_index(map_key, df)
+            if map_cache.get(map_key) is not None:
+                return map_frame(map_key)
+            
             # Create map centered on mean coordinates with high-resolution satellite imagery
             center_lat = df['GPS Latitude'].mean()
             center_lon = df['GPS Longitude'].mean()
@@ -492,57 +549,23 @@ def server(input, output, session):
                 overlay=True
             ).add_to(m)
 
-            point_group = folium.FeatureGroup(name="Households")
-        
-            for idx, row in df.iterrows():
-                # Determine point color based on Revisit-Status
-                point_color = 'red' if row['Revisit-Status'].lower() == 'yes' else 'blue'
-                
-                popup_text = f"""
-                    <div style='min-width: 200px'>
-                        <b>Village:</b> {row['Village']}<br>
-                        <b>Ward:</b> {row['Ward']}<br>
-                        <b>Household ID:</b> {row['HouseholdID']}<br>
-                        <b>Head of Household:</b> {row['Name of Head of Household']}<br>
-                        <b>Revisit Status:</b> {row['Revisit-Status']}<br>
-                        <br>
-                        <a href='https://www.google.com/maps/dir/?api=1&destination={row["GPS Latitude"]},{row["GPS Longitude"]}' 
-                           target='_blank' 
-                           style='background-color: #4CAF50; 
-                                  color: white; 
-                                  padding: 8px 15px; 
-                                  text-decoration: none; 
-                                  border-radius: 4px;
-                                  display: inline-block;'>
-                            Navigate to Household
-                        </a>
-                    </div>
-                """
+            if level_of_detail:
+                # Relative to the map page, so it resolves to this session's points route
+                ClusteredHouseholdLayer(f"household_points?key={map_key}", name="Households").add_to(m)
+                m.fit_bounds([
+                    [df['GPS Latitude'].min(), df['GPS Longitude'].min()],
+                    [df['GPS Latitude'].max(), df['GPS Longitude'].max()]
+                ])
+            else:
+                # Household points as one GeoJSON layer, styled and given popups in the browser
+                HouseholdLayer(household_features(df), name="Households").add_to(m)
                 
-                # Create circle marker (point) with click functionality
-                folium.CircleMarker(
-                    location=[row['GPS Latitude'], row['GPS Longitude']],
-                    radius=8,  # Size of the point
-                    popup=folium.Popup(popup_text, max_width=300),
-                    color=point_color,
-                    fill=True,
-                    fill_color=point_color,
-                    fill_opacity=0.7,
-                    weight=2,
-                    opacity=0.8
-                ).add_to(point_group)
-            
-            point_group.add_to(m)
-            
-            # Add cluster markers for overview
-            marker_cluster = plugins.MarkerCluster(name="Clustered View").add_to(m)
-            for idx, row in df.iterrows():
-                folium.CircleMarker(
-                    [row['GPS Latitude'], row['GPS Longitude']],
-                    radius=8,
-                    color=point_color,
-                    fill=True
-                ).add_to(marker_cluster)
+                # Add cluster markers for overview
+                plugins.FastMarkerCluster(
+                    cluster_points(df),
+                    callback=CLUSTER_CALLBACK,
+                    name="Clustered View"
+                ).add_to(m)
             
             # Add a legend
             legend_html = '''
@@ -583,19 +606,12 @@ def server(input, output, session):
                 secondary_length_unit='kilometers'
             ).add_to(m)
             
-            # Save map to BytesIO object
+            # Save map to BytesIO object and keep it in the shared map cache
             bio = BytesIO()
             m.save(bio, close_file=False)
-            map_html = bio.getvalue().decode()
+            map_cache.put(map_key, bio.getvalue().decode())
             
-            # Return the map in an iframe
-            return ui.div(
-                ui.tags.iframe(
-                    srcDoc=map_html,
-                    style="width: 100%; height: 600px; border: none;",
-                    id="map-frame"
-                )
-            )
+            return map_frame(map_key)
             
         except Exception as e:
             print(f"Error generating map: {str(e)}")
@@ -606,124 +622,146 @@ def server(input, output, session):
     df1 = reactive.value(None)
     df2 = reactive.value(None)
     cleaning_data = reactive.value(None)
+    # Registry key of the cleaning data, naming its version in cached charts
+    cleaning_version = reactive.value(None)
+
+    TARGET_VARIABLES = [
+        "How many people are there in this household?",
+        "7. Sleeping spaces",
+        "calc_num_campaign_nets_hung",
+        "calc_num_campaign_nets_not_hung",
+        "10. Are nets used correctly?"
+    ]
+    # The comparison tab only needs these columns, so only these are read
+    COMPARISON_COLUMNS = [HOUSEHOLD_KEY] + CONTEXT_COLUMNS + TARGET_VARIABLES
     
+    def ingest_upload(file_infos, target, label, columns=None):
+        """Parse an uploaded workbook once, optimise its dtypes and publish it"""
+        def build():
+            df = read_excel_cached(path, columns=columns)
+            df, memory_report = optimize_df(df, report=True, use_schema_cache=True, keep_floats=True)
+            before = memory_report['bytes_before'].sum() / 1024**2
+            after = memory_report['bytes_after'].sum() / 1024**2
+            print(f"Loaded {label}: {before:,.1f} MB -> {after:,.1f} MB after dtype optimisation")
+            return df
+
+        try:
+            path = file_infos[0]['datapath']
+            # Sessions uploading the same file share one copy of it
+            key = ('upload', file_hash(path), tuple(columns) if columns else None)
+            df = datasets.acquire(key, (session.id, label), build)
+            target.set(df)
+            remember(label, df)
+            gc.collect()
+        except Exception as e:
+            print(f"Error loading {label}: {str(e)}")
+
     @reactive.effect
-    def _():
-        file1 = input.file1()
-        if file1 is not None:
-            try:
-                df = pd.read_excel(
-                    file1[0]['datapath'],
-                    engine='openpyxl'
-                )
-                df = optimize_df(df)
-                df1.set(df)
-                gc.collect()
-            except Exception as e:
-                print(f"Error loading file1: {str(e)}")
-    
+    @reactive.event(input.file1)
+    def _upload_df1():
+        ingest_upload(input.file1(), df1, "file1", columns=COMPARISON_COLUMNS)
+
     @reactive.effect
-    def _():
-        file2 = input.file2()
-        if file2 is not None:
-            try:
-                df = pd.read_excel(
-                    file2[0]['datapath'],
-                    engine='openpyxl'
-                )
-                df = optimize_df(df)
-                df2.set(df)
-                gc.collect()
-            except Exception as e:
-                print(f"Error loading file2: {str(e)}")
+    @reactive.event(input.file2)
+    def _upload_df2():
+        ingest_upload(input.file2(), df2, "file2", columns=COMPARISON_COLUMNS)
 
     @reactive.effect
+    @reactive.event(input.cleaning_file)
     def _():
         cleaning_file = input.cleaning_file()
         if cleaning_file is not None:
             try:
-                # Read the Excel file
-                df = pd.read_excel(
-                    cleaning_file[0]['datapath'],
-                    engine='openpyxl'
+                path = cleaning_file[0]['datapath']
+                previous = cleaning_data()
+                incremental = (
+                    input.incremental_upload() and previous is not None and bool(previous.get('signature'))
                 )
                 
-                # Create Villagelist column if both required columns exist
-                if 'calc_l4_name' in df.columns and 'calc_village_name' in df.columns:
-                    l4_name = df['calc_l4_name'].astype(str).replace('nan', '')
-                    village_name = df['calc_village_name'].astype(str).replace('nan', '')
-                    df['Villagelist'] = l4_name + ' ' + village_name
-                
-                # Check if calc_household_id exists before trying to find duplicates
-                if 'calc_household_id' in df.columns:
-                    is_duplicate = df.duplicated(subset=['calc_household_id'], keep=False)
-                    df['Duplicate_Status'] = is_duplicate.map({True: '⚠️ Duplicate', False: ''})
-                    df = df.sort_values('calc_household_id')
-                else:
-                    df['Duplicate_Status'] = ''
-                    is_duplicate = pd.Series([False] * len(df))
-                
-                # Reorder columns to put Duplicate_Status near the start
-                cols = ['Duplicate_Status'] + [col for col in df.columns if col != 'Duplicate_Status']
-                df = df[cols]
-                
-                # Optimize memory usage
-                df = optimize_df(df)
-                
-                # Store both the display data and the duplicate status
-                cleaning_data.set({'df': df, 'is_duplicate': is_duplicate})
+                def build():
+                    # A cumulative export only needs its new rows processed
+                    if incremental:
+                        try:
+                            tail = read_excel_appended(path, previous['signature'])
+                            if tail is not None:
+                                state = append_cleaning_frame(previous, tail)
+                                print(f"cleaning_file: appended {state['appended']:,} new rows")
+                                return state
+                        except Exception as e:
+                            print(f"Error appending rows, loading the whole file: {str(e)}")
+                    return prepare_cleaning_frame(read_excel_cached(path))
                 
-                # Update LGA choices if the column exists
-                if 'calc_l4_name' in df.columns:
-                    lga_choices = sorted(df['calc_l4_name'].unique())
-                    ui.update_select("lga_filter", choices=lga_choices)
+                # Sessions uploading the same export share one copy of its state. An
+                # appended state depends on the state it extends, so it is only shared
+                # with uploads appending the same file to that same state
+                key = ('cleaning', file_hash(path))
+                if incremental:
+                    key += ('append', cleaning_version())
+                state = datasets.acquire(key, (session.id, 'cleaning'), build)
                 
-                # Update pivot table choices
-                numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-                categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
-                
-                ui.update_select("pivot_index", choices=categorical_cols)
-                ui.update_select("pivot_columns", choices=categorical_cols)
-                ui.update_select("pivot_values", choices=numeric_cols)
+                # Store the display data, the duplicate groups and the LGA -> rows index
+                cleaning_data.set(state)
+                cleaning_version.set(key)
+                show_cleaning_state(state)
+                remember('cleaning', state)
                 
                 gc.collect()
                 
             except Exception as e:
                 print(f"Error loading file: {str(e)}")
 
+    def show_cleaning_state(state):
+        """Update the LGA filter and pivot inputs for newly loaded cleaning data"""
+        df = state['df']
+        
+        # Update LGA choices if the column exists
+        if 'calc_l4_name' in df.columns:
+            lga_choices = sorted(df['calc_l4_name'].unique())
+            ui.update_select("lga_filter", choices=lga_choices)
+        
+        # Update pivot table choices
+        numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+        categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
+        
+        ui.update_select("pivot_index", choices=categorical_cols)
+        ui.update_select("pivot_columns", choices=categorical_cols)
+        ui.update_select("pivot_values", choices=numeric_cols)
+
+    @reactive.calc
+    def filtered_positions():
+        """Row positions of the selected LGA, or None when all rows are shown"""
+        if cleaning_data() is None:
+            return None
+        if not input.show_all() and input.lga_filter() and input.lga_filter() != "":
+            return group_positions(cleaning_data()['lga_index'], input.lga_filter())
+        return None
+
     @reactive.calc
     def filtered_df():
         """Get the filtered dataframe based on LGA selection"""
         if cleaning_data() is None:
             return None
         
-        df = cleaning_data()['df'].copy()
-        if not input.show_all() and input.lga_filter() and input.lga_filter() != "":
-            return df[df['calc_l4_name'] == input.lga_filter()]
-        return df
+        # The stored frame is never modified downstream, so no defensive copy
+        df = cleaning_data()['df']
+        positions = filtered_positions()
+        if positions is None:
+            return df
+        return df.take(positions)
 
     @reactive.calc
-    def pivot_filtered_df():
-        """Get filtered dataframe for pivot analysis with additional cleaning"""
-        df = filtered_df()
-        if df is None:
+    def valid_positions():
+        """Row positions of valid interviews, from the mask computed at upload
+        (None when the upload lacks the response columns)"""
+        if cleaning_data() is None or cleaning_data().get('valid') is None:
             return None
-        
-        try:
-            # Filter based on the specified columns
-            mask = (
-                (df['HouseholdFound'].str.contains('yes', case=False, na=False)) &
-                (
-                    (df['FirstVisitPresent'].str.contains('yes', case=False, na=False)) |
-                    (df['FirstVisitPresent'].str.contains('no_but_will_return', case=False, na=False))
-                ) &
-                (df['Consent'].str.contains('yes', case=False, na=False))
-            )
+        return np.flatnonzero(cleaning_data()['valid'])
 
-            return df[mask]
-        except Exception as e:
-            print(f"Error filtering pivot data: {str(e)}")
-            return df  # Return original dataframe if filtering fails
+    # Server-side pages of the cleaned data table, keyed by table id
+    server_tables = {}
+    table_route = session.dynamic_route(
+        "cleaned_data_page", lambda request: table_page_response(request, server_tables)
+    )
 
     @output
     @render.ui
@@ -733,22 +771,20 @@ def server(input, output, session):
         
         try:
             df = filtered_df()
-            is_duplicate = cleaning_data()['is_duplicate']
             
-            # Apply show duplicates filter if enabled
+            # Apply show duplicates filter if enabled, using the precomputed duplicate flags
             if input.show_duplicates():
-                df = df[is_duplicate]
+                is_duplicate = cleaning_data()['duplicates']['is_duplicate']
+                positions = filtered_positions()
+                if positions is None:
+                    positions = np.flatnonzero(is_duplicate)
+                else:
+                    positions = positions[is_duplicate[positions]]
+                df = cleaning_data()['df'].take(positions)
             
             if len(df) == 0:
                 return ui.p("No data available for the selected filters.", class_="text-muted")
             
-            # Limit the number of rows displayed if necessary
-            if len(df) > 100000:
-                df = df.head(100000)
-                message = ui.p("⚠️ Showing first 100,000 rows for performance reasons.", class_="text-warning")
-            else:
-                message = ui.p("")
-            
             # Create custom CSS for styling
             custom_css = """
             <style>
@@ -759,9 +795,42 @@ def server(input, output, session):
             </style>
             """
             
+            # Large tables are paged, searched and sorted on the server
+            if len(df) > SERVER_SIDE_MIN_ROWS:
+                table = ServerTable(df)
+                server_tables.clear()
+                server_tables[table.table_id] = table
+                return ui.div(
+                    ui.HTML(custom_css),
+                    ui.HTML(
+                        DT(
+                            df.head(0),
+                            maxBytes=0,
+                            # Pages hold the columns only, so the header must not add the index
+                            showIndex=False,
+                            layout={"top": "buttons", "topStart": "pageLength", "topEnd": "search"},
+                            keys=True,
+                            classes="display nowrap compact",
+                            buttons=["copyHtml5", "csvHtml5", "excelHtml5", 'print'],
+                            serverSide=True,
+                            processing=True,
+                            ajax={'url': f"{table_route}&table={table.table_id}"},
+                            pageLength=25,
+                            scrollY='400px',
+                            scrollX=True,
+                            createdRow=JavascriptFunction('''
+                                function(row, data, dataIndex) {
+                                    if (data[0] === '⚠️ Duplicate') {
+                                        $(row).addClass('duplicate-row');
+                                    }
+                                }
+                            ''')
+                        )
+                    )
+                )
+            
             return ui.div(
                 ui.HTML(custom_css),
-                message,
                 ui.HTML(
                     DT(
                         df,
@@ -789,41 +858,57 @@ def server(input, output, session):
         except Exception as e:
             return ui.p(f"Error displaying data: {str(e)}", class_="text-danger")
 
+    @reactive.calc
+    def coverage():
+        """Submission counts for all rows and every LGA, computed once per upload"""
+        if cleaning_data() is None:
+            return None
+        state = cleaning_data()
+        return coverage_stats(state['duplicates'], state['lga_index'], state.get('coverage'))
+
+    @reactive.calc
+    def selected_coverage():
+        """Submission counts for the current LGA selection"""
+        stats = coverage()
+        if stats is None:
+            return EMPTY_COVERAGE
+        if filtered_positions() is None:
+            return stats['all']
+        return stats['lgas'].get(input.lga_filter(), EMPTY_COVERAGE)
+
     @output
     @render.text
     def total_submissions():
         if cleaning_data() is None:
             return "0"
-        df = filtered_df()
-        if df is not None:
-            total = len(df)
-            return f"📊 Total Submissions: {total:,}"
-        return "0"
+        total = selected_coverage()['rows']
+        return f"📊 Total Submissions: {total:,}"
 
     @output
     @render.text
     def valid_submissions():
         if cleaning_data() is None:
             return "0"
-        df = filtered_df()
-        if df is not None:
-            # Count distinct household IDs (counting one occurrence per household)
-            valid = df['calc_household_id'].nunique()
-            return f"✅ Valid Submissions: {valid:,}"
-        return "0"
+        # Count distinct household IDs (counting one occurrence per household)
+        valid = selected_coverage()['distinct']
+        return f"✅ Valid Submissions: {valid:,}"
 
     @output
     @render.text
     def duplicate_count():
         if cleaning_data() is None:
             return "0"
-        df = filtered_df()
-        if df is not None:
-            # Count records where household_id appears more than once
-            duplicate_counts = df['calc_household_id'].value_counts()
-            duplicates = duplicate_counts[duplicate_counts > 1].sum() - duplicate_counts[duplicate_counts > 1].size
-            return f"🔄 Duplicate Submissions: {duplicates:,}"
-        return "0"
+        # Count extra records of households that appear more than once
+        duplicates = selected_coverage()['duplicates']
+        return f"🔄 Duplicate Submissions: {duplicates:,}"
+
+    @output
+    @render.text
+    def cross_lga_duplicates():
+        if cleaning_data() is None:
+            return ""
+        cross_lga = selected_coverage()['cross_lga']
+        return f"🌍 Households Submitted in More Than One LGA: {cross_lga:,}"
 
     @render.ui
     def pivot_table():
@@ -834,43 +919,67 @@ def server(input, output, session):
             return ui.p("Please select all pivot table parameters.", class_="text-muted")
         
         try:
-            # df = pivot_filtered_df()
             df = cleaning_data()['df']
-            if df is None or len(df) == 0:
+            positions = valid_positions() if input.pivot_valid_only() else None
+            if df is None or len(df) == 0 or (positions is not None and len(positions) == 0):
                 return ui.p("No data available after applying filters.", class_="text-muted")
             
-            # Calculate total submissions (count all)
-            total_submissions = df.groupby(input.pivot_index())[input.pivot_values()].count()
-            
-            # Calculate valid submissions (unique calc_household_id)
-            valid_submissions = df.groupby(input.pivot_index())['calc_household_id'].nunique()
+            aggfunc = input.pivot_aggfunc()
+            index = input.pivot_index()
             
-            # Combine into a single DataFrame
-            pivot_df = pd.DataFrame({
-                'Total Submissions': total_submissions,
-                'Valid Submissions': valid_submissions
-            }).reset_index()
-            
-            # Add total row
-            total_row = pd.DataFrame({
-                input.pivot_index(): ['Total'],
-                'Total Submissions': [pivot_df['Total Submissions'].sum()],
-                'Valid Submissions': [pivot_df['Valid Submissions'].sum()]
-            })
-            
-            pivot_df = pd.concat([pivot_df, total_row], ignore_index=True)
+            # Counts of an LGA x text column pivot over all rows are precomputed
+            # at upload; otherwise every aggregate and the margins come from one grouped pass
+            cube_cells = None
+            if positions is None and aggfunc in ('count', 'households') and not df[input.pivot_values()].hasnans:
+                cube_cells = cube_pivot(
+                    cleaning_data().get('cube', {}), list(cleaning_data()['lga_index']), 'calc_l4_name',
+                    index, input.pivot_columns()
+                )
+            if cube_cells is not None:
+                row_labels, col_labels, cells = cube_cells
+            else:
+                row_labels, col_labels, cells = pivot_cells(
+                    df, index, input.pivot_columns(), input.pivot_values(), positions
+                )
+            if aggfunc not in cells:
+                return ui.p(f"'{aggfunc}' needs a numeric values column.", class_="text-muted")
+            pivot_df = pivot_frame(row_labels, col_labels, cells[aggfunc], index)
             
-            # Handle NaN values
-            pivot_df = pivot_df.fillna(0)
+            # Submissions and distinct households per row, unless the table already shows them
+            if aggfunc != 'count':
+                pivot_df['Total Submissions'] = cells['count'][:, -1]
+            if aggfunc != 'households':
+                pivot_df['Valid Submissions'] = cells['households'][:, -1]
             
             # Format numeric columns to avoid scientific notation
-            numeric_cols = ['Total Submissions', 'Valid Submissions']
-            for col in numeric_cols:
-                pivot_df[col] = pivot_df[col].apply(lambda x: f"{x:,.0f}")
+            for col in pivot_df.columns[1:]:
+                whole = aggfunc in ('count', 'households') or col in ('Total Submissions', 'Valid Submissions')
+                pivot_df[col] = pivot_df[col].map(
+                    lambda x: "" if pd.isna(x) else f"{x:,.0f}" if whole else f"{x:,.2f}"
+                )
             
             # Optimize pivot table memory
             pivot_df = optimize_df(pivot_df)
             
+            # Submission columns are highlighted by name; the 'Total' margin is
+            # one of them when the table shows counts or households
+            column_classes = {'Total Submissions': 'total-submissions', 'Valid Submissions': 'valid-submissions'}
+            if aggfunc == 'count':
+                column_classes[TOTAL_LABEL] = 'total-submissions'
+            elif aggfunc == 'households':
+                column_classes[TOTAL_LABEL] = 'valid-submissions'
+            column_defs = [
+                {
+                    'targets': position,
+                    'createdCell': JavascriptFunction(f'''
+                        function(td, cellData, rowData, row, col) {{
+                            $(td).addClass('{column_classes[name]}');
+                        }}
+                    ''')
+                }
+                for position, name in enumerate(pivot_df.columns) if name in column_classes
+            ]
+            
             # Custom CSS for the table
             custom_css = """
             <style>
@@ -892,6 +1001,7 @@ def server(input, output, session):
                     DT(
                         pivot_df,
                         maxBytes=0,
+                        showIndex=False,
                         layout={"top": "searchBuilder"}, 
                         keys=True,
                         scrollCollapse=True,
@@ -907,33 +1017,16 @@ def server(input, output, session):
                             'scrollX': True,  # Enable horizontal scrolling
                             'scrollCollapse': True,  # Enable scroll collapse
                             'fixedHeader': True,  # Keep headers visible while scrolling
-                            'autoWidth': True,  # Automatically adjust column widths
-                            'createdRow': '''
-                                function(row, data, dataIndex) {
-                                    if (data[0] === 'Total') {
-                                        $(row).addClass('total-row');
-                                    }
+                            'autoWidth': True  # Automatically adjust column widths
+                        },
+                        createdRow=JavascriptFunction('''
+                            function(row, data, dataIndex) {
+                                if (data[0] === 'Total') {
+                                    $(row).addClass('total-row');
                                 }
-                            ''',
-                            'columnDefs': [
-                                {
-                                    'targets': 1,
-                                    'createdCell': '''
-                                        function(td, cellData, rowData, row, col) {
-                                            $(td).addClass('total-submissions');
-                                        }
-                                    '''
-                                },
-                                {
-                                    'targets': 2,
-                                    'createdCell': '''
-                                        function(td, cellData, rowData, row, col) {
-                                            $(td).addClass('valid-submissions');
-                                        }
-                                    '''
-                                }
-                            ]
-                        }
+                            }
+                        '''),
+                        columnDefs=column_defs
                     )
                 ),
             )
@@ -951,6 +1044,20 @@ def server(input, output, session):
         categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
         ui.update_select("freq_variable", choices=categorical_cols)
 
+    @reactive.calc
+    def frequency_service():
+        """Distinct-household frequencies of the current upload, cached per selection"""
+        if cleaning_data() is None:
+            return None
+        return FrequencyService(cleaning_data())
+
+    @reactive.calc
+    def household_frequencies():
+        """Value counts of the selected variable over distinct households,
+        shared by the frequency table and chart"""
+        lga = input.lga_filter() if filtered_positions() is not None else None
+        return frequency_service().frequencies(input.freq_variable(), lga, input.freq_valid_only())
+
     @render.ui
     def freq_table():
         """Generate frequency table based on distinct household IDs"""
@@ -961,19 +1068,17 @@ def server(input, output, session):
             return ui.p("Please select a variable for analysis.", class_="text-muted")
         
         try:
-            df = filtered_df()
-            if df is None or len(df) == 0:
+            if selected_coverage()['rows'] == 0:
                 return ui.p("No data available after applying filters.", class_="text-muted")
             
-            # Get distinct households
-            distinct_df = df.drop_duplicates(subset=['calc_household_id'])
-            
             # Calculate frequency table
-            freq_df = distinct_df[input.freq_variable()].value_counts().reset_index()
+            freq_df = household_frequencies().reset_index()
             freq_df.columns = [input.freq_variable(), 'Frequency']
             
             # Calculate percentage
             total = freq_df['Frequency'].sum()
+            if total == 0:
+                return ui.p("No data available after applying filters.", class_="text-muted")
             freq_df['Percentage'] = (freq_df['Frequency'] / total * 100).round(2)
             
             # Format percentage
@@ -1033,57 +1138,38 @@ def server(input, output, session):
         except Exception as e:
             return ui.p(f"Error generating frequency table: {str(e)}", class_="text-muted")
 
-    @render.plot
-    def freq_plot():
-        """Generate frequency plots based on distinct household IDs"""
+    @render.ui
+    async def freq_plot():
+        """Frequency charts based on distinct household IDs, drawn off the event loop and cached"""
         if cleaning_data() is None or not input.freq_variable() or not input.chart_types():
             return None
         
         try:
-            df = filtered_df()
-            if df is None or len(df) == 0:
+            if selected_coverage()['rows'] == 0:
                 return None
             
-            # Get distinct households
-            distinct_df = df.drop_duplicates(subset=['calc_household_id'])
-            
             # Calculate frequencies
-            freq_series = distinct_df[input.freq_variable()].value_counts()
-            
-            # Create figure with subplots based on selected chart types
-            n_plots = len(input.chart_types())
-            fig, axes = plt.subplots(1, n_plots, figsize=(7*n_plots, 6))
-            
-            if n_plots == 1:
-                axes = [axes]
-            
-            plot_idx = 0
-            
-            if "Bar Chart" in input.chart_types():
-                # Bar plot
-                freq_series.plot(kind='bar', ax=axes[plot_idx])
-                axes[plot_idx].set_title(f'Bar Chart of {input.freq_variable()} (Distinct Households)')
-                axes[plot_idx].set_xlabel(input.freq_variable())
-                axes[plot_idx].set_ylabel('Frequency (Distinct Households)')
-                plt.setp(axes[plot_idx].xaxis.get_majorticklabels(), rotation=45, ha='right')
-                plot_idx += 1
-            
-            if "Pie Chart" in input.chart_types():
-                # Pie plot
-                freq_series.plot(kind='pie', ax=axes[plot_idx], autopct='%1.1f%%')
-                axes[plot_idx].set_title(f'Pie Chart of {input.freq_variable()} (Distinct Households)')
-                plot_idx += 1
+            freq_series = household_frequencies()
+            if freq_series.sum() == 0:
+                return None
             
-            plt.tight_layout()
-            return fig
+            # The same upload, selection and variable reuse an already drawn chart
+            lga = input.lga_filter() if filtered_positions() is not None else None
+            chart_types = list(input.chart_types())
+            key = chart_cache_key(
+                cleaning_version(), lga, input.freq_valid_only(), input.freq_variable(), chart_types
+            )
+            chart = await frequency_chart(key, freq_series, input.freq_variable(), chart_types)
+            return ui.img(
+                src=f"data:image/png;base64,{base64.b64encode(chart).decode()}",
+                style="max-width: 100%;"
+            )
             
         except Exception as e:
             print(f"Error generating plots: {str(e)}")
             return None
 #===================================Check
 
-    df1 = reactive.value(None)
-    df2 = reactive.value(None)
     locations = reactive.value([])
 
     @reactive.effect
@@ -1112,64 +1198,46 @@ def server(input, output, session):
             return df
         return df[df['calc_l4_name'] == input.column()]
 
-    TARGET_VARIABLES = [
-        "How many people are there in this household?",
-        "7. Sleeping spaces",
-        "calc_num_campaign_nets_hung",
-        "calc_num_campaign_nets_not_hung",
-        "10. Are nets used correctly?"
-    ]
+    comparison_runs = {'count': 0}
 
-    @reactive.effect
-    @reactive.event(input.file1)
-    def _upload_df1():
-        file_infos = input.file1()
-        if not file_infos:
-            df1.set(None)
-            return
-        df1.set(pd.read_excel(file_infos[0]["datapath"]))
-
-    @reactive.effect
-    @reactive.event(input.file2)
-    def _upload_df2():
-        file_infos = input.file2()
-        if not file_infos:
-            df2.set(None)
-            return
-        df2.set(pd.read_excel(file_infos[0]["datapath"]))
+    @reactive.calc
+    def comparison_result():
+        """Merge and score main vs revisit data once, shared by all comparison outputs.
 
-    def calculate_similarity(val1, val2):
-        str1 = str(val1).lower().strip()
-        str2 = str(val2).lower().strip()
+        Returns None until both files are uploaded, and (None, None) when the
+        selected location has no rows.
+        """
+        if df1() is None or df2() is None:
+            return None
         
-        if pd.isna(val1) and pd.isna(val2):
-            return 1.0
-        elif pd.isna(val1) or pd.isna(val2):
-            return 0.0
-        elif str1 == str2:
-            return 1.0
-        else:
-            return 0.0
-
-    def calculate_score(similarity):
-        return 1 if similarity == 1.0 else -1
+        df1_filtered = filter_by_location(df1())
+        if df1_filtered.empty:
+            return None, None
+        
+        counts, detail = compare_variables(
+            df1_filtered, df2(), TARGET_VARIABLES, duplicates=input.revisit_duplicates()
+        )
+        comparison_runs['count'] += 1
+        print(f"Comparison run #{comparison_runs['count']}: {len(detail):,} values compared")
+        return counts, detail
 
     @render.text
     def comparison_title():
-        df1_filtered = filter_by_location(df1())
-        if df1_filtered is None or df1_filtered.empty:
+        result = comparison_result()
+        if result is None:
+            return ""
+        if result[0] is None:
             return "No data available for selected location."
-        if df1() is not None and df2() is not None:
-            return "Comparison Results for All Target Variables"
-        return ""
+        return "Comparison Results for All Target Variables"
 
     @render.code
     def similarity_score():
-        if df1() is None or df2() is None:
+        result = comparison_result()
+        if result is None:
             return "Please upload both files to see comparisons."
             
-        df1_filtered = filter_by_location(df1())
-        if df1_filtered is None or df1_filtered.empty:
+        counts, _ = result
+        if counts is None:
             return "No data available for selected location."
         
         summary_parts = []
@@ -1180,28 +1248,7 @@ def server(input, output, session):
         
         summary_parts.append("📊 DETAILED ANALYSIS SUMMARY\n" + line)
         
-        for var in TARGET_VARIABLES:
-            if var not in df1_filtered.columns or var not in df2().columns:
-                continue
-                    
-            merged_df = pd.merge(
-                df1_filtered,
-                df2()[[var, 'calc_household_id']],
-                on='calc_household_id',
-                how='inner',
-                suffixes=('_1', '_2')
-            )
-            
-            perfect_matches = 0
-            total = len(merged_df)
-            
-            for _, row in merged_df.iterrows():
-                val1 = row[f"{var}_1"] if f"{var}_1" in merged_df.columns else row[var]
-                val2 = row[f"{var}_2"]
-                similarity = calculate_similarity(val1, val2)
-                if similarity == 1.0:
-                    perfect_matches += 1
-            
+        for var, perfect_matches, total in counts.itertuples(index=False):
             percentage = (perfect_matches / total) * 100 if total > 0 else 0
             total_matches += perfect_matches
             total_records += total
@@ -1229,36 +1276,16 @@ def server(input, output, session):
 
     @render.text
     def match_counts():
-        if df1() is None or df2() is None:
+        result = comparison_result()
+        if result is None:
             return ""
         
-        df1_filtered = filter_by_location(df1())
-        if df1_filtered is None or df1_filtered.empty:
+        counts, _ = result
+        if counts is None:
             return "No data available for selected location."
         
-        total_matches = 0
-        total_mismatches = 0
-        
-        for var in TARGET_VARIABLES:
-            if var not in df1_filtered.columns or var not in df2().columns:
-                continue
-                    
-            merged_df = pd.merge(
-                df1_filtered,
-                df2()[[var, 'calc_household_id']],
-                on='calc_household_id',
-                how='inner',
-                suffixes=('_1', '_2')
-            )
-            
-            for _, row in merged_df.iterrows():
-                val1 = row[f"{var}_1"] if f"{var}_1" in merged_df.columns else row[var]
-                val2 = row[f"{var}_2"]
-                similarity = calculate_similarity(val1, val2)
-                if similarity == 1.0:
-                    total_matches += 1
-                else:
-                    total_mismatches += 1
+        total_matches = int(counts['Matches'].sum())
+        total_mismatches = int(counts['Total'].sum()) - total_matches
         
         total = total_matches + total_mismatches
         return f"""
@@ -1270,55 +1297,16 @@ def server(input, output, session):
 
     @render.ui
     def similarity_table():
-        if df1() is None or df2() is None:
+        result = comparison_result()
+        if result is None:
             return ui.p("Upload files to see comparison results.", class_="text-muted")
         
-        df1_filtered = filter_by_location(df1())
-        if df1_filtered is None or df1_filtered.empty:
+        _, result_df = result
+        if result_df is None:
             return ui.p("No data available for selected location.", class_="text-warning")
         
-        all_comparisons = []
-        
-        for var in TARGET_VARIABLES:
-            if var not in df1_filtered.columns or var not in df2().columns:
-                continue
-                    
-            merged_df = pd.merge(
-                df1_filtered,
-                df2()[[var, 'calc_household_id']],
-                on='calc_household_id',
-                how='inner',
-                suffixes=('_1', '_2')
-            )
-            
-            comparison_data = []
-            for _, row in merged_df.iterrows():
-                val1 = row[f"{var}_1"] if f"{var}_1" in merged_df.columns else row[var]
-                val2 = row[f"{var}_2"]
-                similarity = calculate_similarity(val1, val2)
-                score = calculate_score(similarity)
-                
-                village = (f"{row['calc_l4_name']} - {row['calc_village_name']}" 
-                        if 'calc_l4_name' in merged_df.columns and 'calc_village_name' in merged_df.columns 
-                        else 'N/A')
-                hh_id = row['calc_household_id']
-                
-                comparison_data.append({
-                    'Variable': var,
-                    'Village': village,
-                    'Household ID': hh_id,
-                    'Main': val1,
-                    'Revisit': val2,
-                    'Match': '✅ Yes' if similarity == 1.0 else '❌ No',
-                    'Score': f"{score:+d}"
-                })
-            
-            all_comparisons.extend(comparison_data)
-        
-        if not all_comparisons:
+        if result_df.empty:
             return ui.p("No comparisons could be generated.", class_="text-warning")
-                
-        result_df = pd.DataFrame(all_comparisons)
         
         return ui.HTML(
             DT(
@@ -0,0 +1,61 @@
+"""Time build_schedule for all LGAs, serial and with 2..N pool workers.
+
+Usage: python benchmarks/schedule_benchmark.py [rows] [lgas] [repeats]
+Set PDM_SCHEDULE_WORKERS to the fastest worker count on your server.
+"""
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utility.schedule import build_schedule
+
+
+def deployment_frame(rows, lgas, seed=0):
+    """Synthetic deployment upload: villages spread over wards of each LGA"""
+    rng = np.random.default_rng(seed)
+    lga = rng.integers(0, lgas, rows)
+    return pd.DataFrame({
+        'LGA': [f"LGA {i:02d}" for i in lga],
+        'Ward': [f"Ward {i}" for i in lga * 100 + rng.integers(0, 12, rows)],
+        'Village': [f"Village {i}" for i in range(rows)],
+        'REVISIT STATUS': rng.choice(['YES', 'NO'], rows, p=[0.1, 0.9])
+    })
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    lgas = int(sys.argv[2]) if len(sys.argv) > 2 else 24
+    repeats = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+
+    df = deployment_frame(rows, lgas)
+    mapping = {name: [f"{name}_SUP{j + 1}" for j in range(3)] for name in df['LGA'].unique()}
+    args = (df, None, mapping, 4, 20, 60, datetime(2026, 1, 1))
+
+    cores = os.cpu_count() or 1
+    print(f"{rows:,} rows, {lgas} LGAs, {cores} CPU core(s)")
+    serial = None
+    expected = None
+    for workers in [1] + [w for w in (2, 4, 8, 16) if w <= max(cores, 2)]:
+        # The first parallel call also starts the pool; time the calls after it
+        build_schedule(*args, workers=workers, parallel_min_rows=0)
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = build_schedule(*args, workers=workers, parallel_min_rows=0)
+            times.append(time.perf_counter() - start)
+        best = min(times)
+        serial = serial or best
+        # Results are merged in LGA order, so every worker count gives the same schedule
+        if expected is None:
+            expected = result
+        pd.testing.assert_frame_equal(result, expected)
+        print(f"workers={workers:2d}  {best:6.2f} s  speedup {serial / best:4.2f}x  ({len(result):,} schedule rows)")
+
+
+if __name__ == '__main__':
+    main()
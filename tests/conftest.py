@@ -0,0 +1,11 @@
+import pytest
+
+from utility import helper, loader, workspace
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(monkeypatch, tmp_path):
+    """Every test gets an empty upload cache, dtype plan store and workspace dir"""
+    monkeypatch.setattr(loader, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(workspace, 'WORKSPACE_DIR', str(tmp_path / 'workspaces'))
+    monkeypatch.setattr(helper, 'schema_plans', {})
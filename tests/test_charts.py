@@ -0,0 +1,41 @@
+import json
+
+import pandas as pd
+import pytest
+from websockets.sync.client import connect
+
+from tests.test_ingest import receive_until, server, upload
+from utility import charts
+
+
+@pytest.fixture
+def empty_chart_cache(monkeypatch):
+    monkeypatch.setattr(charts, 'chart_cache', charts.SizedLRU(charts.CHART_CACHE_MAX_BYTES))
+
+
+def test_frequency_chart_renders_in_the_app(server, empty_chart_cache, tmp_path):
+    path = tmp_path / 'cleaning.xlsx'
+    pd.DataFrame({
+        'calc_household_id': [f"hh{i % 15}" for i in range(20)],
+        'calc_l4_name': ['LGA 1', 'LGA 2'] * 10,
+        'calc_village_name': 'Village',
+        'Sex': ['M', 'F', 'F', 'M'] * 5
+    }).to_excel(path, index=False)
+
+    with connect(f"ws://{server}/websocket/", max_size=None) as ws:
+        ws.send(json.dumps({'method': 'init', 'data': {
+            '.clientdata_url_search': '',
+            '.clientdata_output_freq_plot_hidden': False,
+            'incremental_upload': False,
+            'show_all': True,
+            'lga_filter': '',
+            'chart_types': ['Bar Chart', 'Pie Chart'],
+            'freq_valid_only': False
+        }}))
+        receive_until(ws, lambda m: m.get('busy') == 'idle')
+
+        upload(server, ws, path, 'cleaning_file', 10)
+        ws.send(json.dumps({'method': 'update', 'data': {'freq_variable': 'Sex'}}))
+        message = receive_until(ws, lambda m: (m.get('values') or {}).get('freq_plot') is not None)
+
+    assert 'data:image/png;base64,' in message['values']['freq_plot']['html']
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+from utility.cleaning import append_cleaning_frame, coverage_stats, prepare_cleaning_frame
+
+
+def survey_rows(rng, n, start):
+    """Raw export rows with repeated and missing household IDs"""
+    df = pd.DataFrame({
+        'calc_household_id': rng.choice([f'HH{i:05d}' for i in range(int(n * 0.8))] + [None], n),
+        'calc_l4_name': rng.choice(['Ado', 'Bida', 'Ekiti', None], n),
+        'calc_village_name': rng.choice([f'V{i}' for i in range(20)], n),
+        'Sex': rng.choice(['M', 'F'], n),
+        'HouseholdFound': rng.choice(['Yes', 'No'], n),
+        'FirstVisitPresent': rng.choice(['yes', 'no_but_will_return', 'no'], n),
+        'Consent': rng.choice(['Yes', 'No'], n)
+    })
+    df.index = range(start, start + n)
+    return df
+
+
+def cube_cells(cube, lgas):
+    """Non-zero cube counts keyed by column, LGA and value labels"""
+    cells = {}
+    lga_labels = [str(lga) for lga in lgas] + ['all']
+    for name, entry in cube.items():
+        labels = [str(label) for label in entry['labels']]
+        for key in ('rows', 'households', 'first'):
+            for i, j in zip(*np.nonzero(entry[key])):
+                cells[(name, key, lga_labels[i], labels[j])] = int(entry[key][i, j])
+        for i in np.flatnonzero(entry['lga_households']):
+            cells[(name, 'lga_households', lga_labels[i])] = int(entry['lga_households'][i])
+        for j in np.flatnonzero(entry['value_households']):
+            cells[(name, 'value_households', labels[j])] = int(entry['value_households'][j])
+        cells[(name, 'total_households')] = entry['total_households']
+    return cells
+
+
+def test_append_matches_full_rebuild():
+    rng = np.random.default_rng(3)
+    raw = survey_rows(rng, 3000, 0)
+    state = prepare_cleaning_frame(raw.copy())
+
+    first = survey_rows(rng, 400, 3000)
+    first.loc[first.index[:3], 'calc_l4_name'] = 'Gombe'
+    first.loc[first.index[3:6], 'Sex'] = 'X'
+    for tail in (first, survey_rows(rng, 400, 3400)):
+        raw = pd.concat([raw, tail])
+        full = prepare_cleaning_frame(raw.copy())
+        state = append_cleaning_frame(state, tail.copy())
+
+        for key in ('group_size', 'is_first', 'is_duplicate', 'cross_lga', 'has_id'):
+            assert (full['duplicates'][key] == state['duplicates'][key]).all(), key
+        assert list(full['lga_index']) == list(state['lga_index'])
+        for lga, rows in full['lga_index'].items():
+            assert (rows == state['lga_index'][lga]).all()
+        assert (full['valid'] == state['valid']).all()
+        assert coverage_stats(full['duplicates'], full['lga_index']) == \
+            coverage_stats(state['duplicates'], state['lga_index'], state['coverage'])
+        assert cube_cells(full['cube'], full['lga_index']) == cube_cells(state['cube'], state['lga_index'])
+
+
+def test_numeric_responses_do_not_break_the_upload():
+    raw = pd.DataFrame({
+        'calc_household_id': ['HH1', 'HH2', 'HH3', 'HH4'],
+        'calc_l4_name': 'Ado',
+        'calc_village_name': 'V1',
+        'HouseholdFound': [1, 0, 1, 1],
+        'FirstVisitPresent': ['yes', 'yes', 'no', 'yes'],
+        'Consent': ['Yes', 'Yes', 'Yes', 1]
+    })
+    state = prepare_cleaning_frame(raw)
+    # A response is matched by its text, so coded 1/0 answers are not 'yes'
+    assert not state['valid'].any()
+
+    tail = raw.iloc[:2].copy()
+    tail.index = [4, 5]
+    tail['HouseholdFound'] = ['Yes', 'No']
+    tail['Consent'] = ['Yes', 'Yes']
+    state = append_cleaning_frame(state, tail)
+    assert state['valid'].sum() == 1
@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utility.comparison import HOUSEHOLD_KEY, compare_variables
+from utility.helper import optimize_df
+
+
+def calculate_similarity(val1, val2):
+    """Per-value comparison used by the Data Comparison tab before compare_variables"""
+    str1 = str(val1).lower().strip()
+    str2 = str(val2).lower().strip()
+
+    if pd.isna(val1) and pd.isna(val2):
+        return 1.0
+    elif pd.isna(val1) or pd.isna(val2):
+        return 0.0
+    elif str1 == str2:
+        return 1.0
+    else:
+        return 0.0
+
+
+def iterrows_comparison(main_df, revisit_df, variables):
+    """The old per-variable merge + iterrows loop, as (counts, detail) frames"""
+    counts = []
+    rows = []
+    for var in variables:
+        if var not in main_df.columns or var not in revisit_df.columns:
+            continue
+        merged_df = pd.merge(
+            main_df,
+            revisit_df[[var, HOUSEHOLD_KEY]],
+            on=HOUSEHOLD_KEY,
+            how='inner',
+            suffixes=('_1', '_2')
+        )
+        matches = 0
+        for _, row in merged_df.iterrows():
+            val1 = row[f"{var}_1"]
+            val2 = row[f"{var}_2"]
+            similarity = calculate_similarity(val1, val2)
+            matches += similarity == 1.0
+            village = (f"{row['calc_l4_name']} - {row['calc_village_name']}"
+                       if 'calc_l4_name' in merged_df.columns and 'calc_village_name' in merged_df.columns
+                       else 'N/A')
+            rows.append({
+                'Variable': var,
+                'Village': village,
+                'Household ID': row[HOUSEHOLD_KEY],
+                'Main': val1,
+                'Revisit': val2,
+                'Match': '✅ Yes' if similarity == 1.0 else '❌ No',
+                'Score': f"{1 if similarity == 1.0 else -1:+d}"
+            })
+        counts.append({'Variable': var, 'Matches': int(matches), 'Total': len(merged_df)})
+    return pd.DataFrame(counts), pd.DataFrame(rows)
+
+
+def assert_parity(main_df, revisit_df, variables):
+    expected_counts, expected_detail = iterrows_comparison(main_df, revisit_df, variables)
+    counts, detail = compare_variables(main_df, revisit_df, variables)
+
+    pd.testing.assert_frame_equal(counts, expected_counts, check_dtype=False)
+    assert len(detail) == len(expected_detail)
+    for column in ['Variable', 'Village', 'Household ID', 'Match', 'Score']:
+        assert detail[column].astype(str).tolist() == expected_detail[column].astype(str).tolist(), column
+
+
+def frames(main_values, revisit_values, village=True):
+    ids = [f"hh{i}" for i in range(len(main_values))]
+    main_df = pd.DataFrame({HOUSEHOLD_KEY: ids, 'answer': main_values})
+    if village:
+        main_df['calc_l4_name'] = 'LGA 1'
+        main_df['calc_village_name'] = [f"Village {i % 3}" for i in range(len(ids))]
+    revisit_df = pd.DataFrame({HOUSEHOLD_KEY: ids, 'answer': revisit_values})
+    return main_df, revisit_df
+
+
+def test_missing_values():
+    # Both missing is a match, one missing is not
+    main_df, revisit_df = frames(['yes', np.nan, np.nan, None, 'no'], ['yes', np.nan, 'no', np.nan, None])
+    assert_parity(main_df, revisit_df, ['answer'])
+
+
+def test_whitespace_and_case():
+    main_df, revisit_df = frames([' Yes', 'NO ', 'Maybe', 'a b'], ['yes', 'no', ' maybe ', 'a  b'])
+    assert_parity(main_df, revisit_df, ['answer'])
+
+
+@pytest.mark.parametrize('main_values, revisit_values', [
+    ([3, 4, 5, 6], [3.0, 4.5, np.nan, 6.0]),
+    ([3.0, 4.0, np.nan, 6.5], [3, 4, 5, 6]),
+    ([3, 4, 5, 6], ['3', '4.0', ' 5 ', 'six']),
+    (pd.to_datetime(['2024-01-01', '2024-01-02', None, '2024-01-04']),
+     ['2024-01-01 00:00:00', '2024-01-02', None, pd.Timestamp('2024-01-04')]),
+    (pd.array([3, None, 5, 6], dtype='Int64'), [3.0, np.nan, 5.0, 7.0]),
+])
+def test_numbers_of_different_types(main_values, revisit_values):
+    main_df, revisit_df = frames(main_values, revisit_values)
+    assert_parity(main_df, revisit_df, ['answer'])
+
+
+def test_repeated_households_and_missing_variables():
+    main_df = pd.DataFrame({
+        HOUSEHOLD_KEY: ['a', 'b', 'c', 'd'],
+        'calc_l4_name': ['L1', 'L1', 'L2', 'L2'],
+        'calc_village_name': ['V1', 'V2', 'V3', 'V4'],
+        'q1': ['x', 'y', 'z', np.nan],
+        'q2': [1, 2, 3, 4]
+    })
+    revisit_df = pd.DataFrame({
+        HOUSEHOLD_KEY: ['a', 'a', 'c', 'd', 'e'],
+        'q1': ['X', 'x ', 'w', np.nan, 'v'],
+        'q2': [1.0, 2.0, 3.0, np.nan, 5.0]
+    })
+    assert_parity(main_df, revisit_df, ['q1', 'q2', 'not_in_files'])
+
+
+@pytest.mark.parametrize('main_values, revisit_values', [
+    ([3.0, np.nan, 4.0], [3.0, 4.5, 4.0]),
+    ([3, 4, 5], [3.0, np.nan, 5.0]),
+    ([1.5, 2.0, np.nan], [1.5, 2, 7]),
+])
+def test_optimised_uploads_compare_like_the_read_frames(main_values, revisit_values):
+    # Uploads are optimised file by file, as ingest_upload does, before they are compared
+    main_df, revisit_df = frames(main_values, revisit_values)
+    expected_counts, _ = iterrows_comparison(main_df, revisit_df, ['answer'])
+    counts, _ = compare_variables(
+        optimize_df(main_df, keep_floats=True), optimize_df(revisit_df, keep_floats=True), ['answer']
+    )
+    pd.testing.assert_frame_equal(counts, expected_counts, check_dtype=False)
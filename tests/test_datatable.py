@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utility import datatable
+from utility.datatable import ServerTable
+
+
+def shown_rows(df, term):
+    """Rows whose text, as the table pages show it, contains the term"""
+    shown = df.astype(object).where(df.notna(), '').astype(str)
+    mask = np.zeros(len(df), dtype=bool)
+    for name in shown.columns:
+        mask |= shown[name].str.lower().str.contains(term.lower(), regex=False).to_numpy()
+    return np.flatnonzero(mask)
+
+
+@pytest.mark.parametrize('max_matches', [datatable.MAX_FIND_MATCHES, 0])
+def test_search_matches_the_shown_text(monkeypatch, max_matches):
+    monkeypatch.setattr(datatable, 'MAX_FIND_MATCHES', max_matches)
+    df = pd.DataFrame({
+        'status': pd.Categorical(['✓ Unique', '⚠️ Duplicate', None, '✓ Unique'] * 3),
+        'name': ['Ada', 'BOLA', None, 'ada obi', 'Chi', 'nan', 'x', 'y', 'Ada', 'z', 'q', 'w'],
+        'count': pd.array([3, None, 12, 4] * 3, dtype='UInt8'),
+        'income': [1.5, np.nan, 12.0, 3.25] * 3,
+        'when': pd.to_datetime(['2024-01-12 10:00:00', None, '2024-02-01 12:30:00', '2024-01-12 10:00:00'] * 3),
+        'mixed': [1, 'One', 2.5, None] * 3
+    })
+    table = ServerTable(df)
+    for term in ('ada', 'DUPLICATE', '12', 'nan', 'one', '2024-01-12 10:00', '.5', 'zzz', '2'):
+        response = table.page(1, 0, -1, term)
+        assert response['recordsFiltered'] == len(shown_rows(df, term)), term
+        assert table.search_mask(term).nonzero()[0].tolist() == shown_rows(df, term).tolist(), term
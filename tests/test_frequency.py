@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+from utility.cleaning import prepare_cleaning_frame
+from utility.frequency import FrequencyService
+
+
+def test_fallback_counts_match_cube_counts():
+    rng = np.random.default_rng(5)
+    n = 600
+    raw = pd.DataFrame({
+        'calc_household_id': rng.choice([f'HH{i:04d}' for i in range(400)], n),
+        'calc_l4_name': rng.choice(['Ado', 'Bida'], n),
+        'calc_village_name': rng.choice(['V1', 'V2'], n),
+        'Water': rng.choice(['Well', 'Tap', 'River'], n)
+    })
+    # A value only seen in one LGA is an unused category in the other
+    raw.loc[raw['calc_l4_name'] == 'Bida', 'Water'] = 'Borehole'
+    state = prepare_cleaning_frame(raw)
+    assert 'Water' in state['cube']
+
+    cached = FrequencyService(state)
+    fallback = FrequencyService(dict(state, cube={}))
+    for lga in (None, 'Ado', 'Bida'):
+        expected = cached.frequencies('Water', lga)
+        counts = fallback.frequencies('Water', lga)
+        assert (counts > 0).all()
+        assert dict(zip(counts.index.astype(str), counts)) == dict(zip(expected.index.astype(str), expected))
@@ -0,0 +1,128 @@
+import json
+import socket
+import threading
+import time
+import urllib.request
+
+import pandas as pd
+import pytest
+import uvicorn
+from websockets.sync.client import connect
+
+import app as pdm_app
+from utility import loader
+
+
+XLSX_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+@pytest.fixture
+def server():
+    """The app served in this process, so patched parsers are the ones it calls"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    uv = uvicorn.Server(uvicorn.Config(pdm_app.app, host='127.0.0.1', port=port, log_level='warning'))
+    thread = threading.Thread(target=uv.run, daemon=True)
+    thread.start()
+    while not uv.started:
+        time.sleep(0.05)
+    yield f"127.0.0.1:{port}"
+    uv.should_exit = True
+    thread.join(timeout=10)
+
+
+@pytest.fixture
+def parse_calls(monkeypatch):
+    """Count every workbook parse (the cache starts empty, see conftest.py)"""
+    calls = []
+
+    def spy(name, function):
+        def counted(*args, **kwargs):
+            calls.append(name)
+            return function(*args, **kwargs)
+        return counted
+
+    monkeypatch.setattr(loader, 'read_excel_columns', spy('read_excel_columns', loader.read_excel_columns))
+    monkeypatch.setattr(pd, 'read_excel', spy('read_excel', pd.read_excel))
+    return calls
+
+
+def receive_until(ws, done):
+    while True:
+        message = json.loads(ws.recv(timeout=60))
+        if done(message):
+            return message
+
+
+def upload(host, ws, path, input_id, tag):
+    """Upload a file to a file input the way the browser does"""
+    data = path.read_bytes()
+    ws.send(json.dumps({
+        'method': 'uploadInit',
+        'args': [[{'name': path.name, 'size': len(data), 'type': XLSX_TYPE}]],
+        'tag': tag
+    }))
+    job = receive_until(ws, lambda m: m.get('response', {}).get('tag') == tag)['response']['value']
+    urllib.request.urlopen(urllib.request.Request(f"http://{host}/{job['uploadUrl']}", data=data, method='POST'))
+    ws.send(json.dumps({'method': 'uploadEnd', 'args': [job['jobId'], input_id], 'tag': tag + 1}))
+    receive_until(ws, lambda m: m.get('response', {}).get('tag') == tag + 1)
+    receive_until(ws, lambda m: m.get('busy') == 'idle')
+
+
+def workbook(path, offset):
+    pd.DataFrame({
+        'calc_household_id': [f"hh{offset + i}" for i in range(20)],
+        'calc_l4_name': 'LGA 1',
+        'calc_village_name': 'Village',
+        'calc_num_campaign_nets_hung': range(offset, offset + 20)
+    }).to_excel(path, index=False)
+    return path
+
+
+def test_each_comparison_upload_is_parsed_once(server, parse_calls, tmp_path):
+    file1 = workbook(tmp_path / 'main.xlsx', 0)
+    file2 = workbook(tmp_path / 'revisit.xlsx', 10)
+
+    with connect(f"ws://{server}/websocket/") as ws:
+        ws.send(json.dumps({'method': 'init', 'data': {'.clientdata_url_search': ''}}))
+        receive_until(ws, lambda m: m.get('busy') == 'idle')
+
+        upload(server, ws, file1, 'file1', 10)
+        assert len(parse_calls) == 1
+        upload(server, ws, file2, 'file2', 20)
+        assert len(parse_calls) == 2
+
+
+def cleaning_session(host, path_steps, incremental):
+    """Upload cleaning files in one session; returns the session id"""
+    with connect(f"ws://{host}/websocket/") as ws:
+        ws.send(json.dumps({'method': 'init', 'data': {
+            '.clientdata_url_search': '', 'incremental_upload': incremental
+        }}))
+        session_id = receive_until(ws, lambda m: 'config' in m)['config']['sessionId']
+        receive_until(ws, lambda m: m.get('busy') == 'idle')
+        for tag, path in enumerate(path_steps):
+            upload(host, ws, path, 'cleaning_file', 10 * (tag + 1))
+        holder_key = pdm_app.datasets.holders[(session_id, 'cleaning')]
+        return holder_key, pdm_app.datasets.entries[holder_key]['value']
+
+
+def test_appended_state_is_not_shared_with_full_uploads(server, parse_calls, tmp_path):
+    rows = pd.DataFrame({
+        'calc_household_id': [f"hh{i % 25}" for i in range(40)],
+        'calc_l4_name': ['LGA 1', 'LGA 2'] * 20,
+        'calc_village_name': 'Village',
+        'Sex': ['M', 'F', 'F', 'M'] * 10
+    })
+    day1 = tmp_path / 'day1.xlsx'
+    day2 = tmp_path / 'day2.xlsx'
+    rows.iloc[:30].to_excel(day1, index=False)
+    rows.to_excel(day2, index=False)
+
+    appended_key, appended = cleaning_session(server, [day1, day2], incremental=True)
+    full_key, full = cleaning_session(server, [day2], incremental=False)
+
+    assert appended['appended'] == 10
+    assert full_key != appended_key
+    assert 'appended' not in full
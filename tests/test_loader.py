@@ -0,0 +1,38 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from utility import loader
+
+
+def test_mixed_columns_are_cached(tmp_path, monkeypatch):
+    path = tmp_path / 'export.xlsx'
+    pd.DataFrame({
+        'calc_household_id': ['hh1', 'hh2', 'hh3', 'hh4'],
+        # Numbers and text in one column, as KoBo exports often have
+        'answer': [1, 'two', 3.5, None]
+    }).to_excel(path, index=False)
+    cache_dir = str(tmp_path / 'cache')
+
+    first = loader.read_excel_cached(str(path), cache_dir=cache_dir)
+    assert [name for name in os.listdir(cache_dir) if not name.startswith('.')] == [
+        f"{loader.file_hash(str(path))}.pkl"
+    ]
+
+    def no_parse(*args, **kwargs):
+        raise AssertionError("workbook parsed again")
+    monkeypatch.setattr(pd, 'read_excel', no_parse)
+    cached = loader.read_excel_cached(str(path), cache_dir=cache_dir)
+
+    pd.testing.assert_frame_equal(cached, first)
+    assert [type(value) for value in cached['answer'][:3]] == [int, str, float]
+    assert np.isnan(cached['answer'][3])
+
+
+def test_single_type_columns_stay_parquet(tmp_path):
+    stem = str(tmp_path / 'frame')
+    df = pd.DataFrame({'text': ['a', None], 'number': [1.5, np.nan]})
+    assert loader.write_frame(df, stem) == f"{stem}.parquet"
+    restored = loader.read_frame(f"{stem}.parquet")
+    pd.testing.assert_frame_equal(restored, df)
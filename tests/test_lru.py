@@ -0,0 +1,26 @@
+from utility.lru import SizedLRU
+from utility.maps import MapCache
+
+
+def test_evicts_least_recently_used_over_budget():
+    cache = SizedLRU(10)
+    cache.put('a', b'1234')
+    cache.put('b', b'1234')
+    cache.get('a')
+    cache.put('c', b'1234')
+    assert cache.get('b') is None
+    assert cache.get('a') == b'1234' and cache.get('c') == b'1234'
+    assert cache.total == 8
+
+
+def test_keeps_newest_value_over_budget():
+    cache = SizedLRU(2)
+    cache.put('a', b'1234')
+    assert cache.get('a') == b'1234'
+
+
+def test_map_pages_are_sized_with_their_gzip_body():
+    cache = MapCache(10 ** 6)
+    page = cache.put('key', '<html>' + 'x' * 1000 + '</html>')
+    assert cache.get('key') is page
+    assert cache.total == len(page.body) + len(page.gzip_body)
@@ -0,0 +1,30 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from utility import workspace
+from utility.cleaning import prepare_cleaning_frame
+
+
+def test_cleaning_state_with_mixed_column_is_restored(tmp_path, monkeypatch):
+    monkeypatch.setattr(workspace, 'WORKSPACE_DIR', str(tmp_path))
+    raw = pd.DataFrame({
+        'calc_household_id': [f"hh{i % 6}" for i in range(12)],
+        'calc_l4_name': ['Ado', 'Bida', None] * 4,
+        'calc_village_name': 'V1',
+        # Numbers and text in one column, as KoBo exports often have
+        'answer': [1, 'two', 3.5, None] * 3
+    })
+    state = prepare_cleaning_frame(raw)
+    token = workspace.new_token()
+
+    workspace.save_entry(token, 'cleaning', state)
+    assert os.path.isdir(os.path.join(str(tmp_path), token, 'cleaning'))
+    restored = workspace.load_entry(token, 'cleaning')
+
+    pd.testing.assert_frame_equal(restored['df'], state['df'])
+    assert list(restored['duplicates']['ids']) == list(state['duplicates']['ids'])
+    for key in ('group_id', 'is_duplicate', 'cross_lga'):
+        assert np.array_equal(restored['duplicates'][key], state['duplicates'][key])
+    assert list(restored['lga_index']) == list(state['lga_index'])
@@ -0,0 +1,88 @@
+import asyncio
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+
+from utility.lru import SizedLRU
+
+
+# Memory budget for rendered charts shared by all sessions
+CHART_CACHE_MAX_BYTES = int(os.environ.get('PDM_CHART_CACHE_MAX_MB', '64')) * 1024 * 1024
+# Categories drawn before the rest are grouped as 'Other'
+CHART_TOP_N = int(os.environ.get('PDM_CHART_TOP_N', '20'))
+OTHER_LABEL = 'Other'
+
+# Charts are drawn off the event loop, so a slow chart never holds up other outputs
+_renderer = ThreadPoolExecutor(max_workers=2)
+
+
+def top_categories(freq_series, top_n=None):
+    """The top_n most frequent values, with the remaining counts summed as 'Other'"""
+    top_n = CHART_TOP_N if top_n is None else top_n
+    freq_series = freq_series[freq_series > 0].sort_values(ascending=False, kind='stable')
+    labels = [str(label) for label in freq_series.index]
+    values = freq_series.to_numpy(dtype='float64')
+    if len(values) > top_n:
+        labels = labels[:top_n] + [OTHER_LABEL]
+        values = np.append(values[:top_n], values[top_n:].sum())
+    return pd.Series(values, index=labels)
+
+
+def render_frequency_chart(freq_series, variable, chart_types, top_n=None):
+    """Bar and/or pie chart of household frequencies as PNG bytes.
+
+    Uses a standalone Figure rather than pyplot, so charts can be drawn in
+    worker threads without sharing pyplot's global state.
+    """
+    counts = top_categories(freq_series, top_n)
+    positions = np.arange(len(counts))
+
+    fig = Figure(figsize=(7 * len(chart_types), 6))
+    axes = fig.subplots(1, len(chart_types), squeeze=False)[0]
+    plot_idx = 0
+
+    if "Bar Chart" in chart_types:
+        ax = axes[plot_idx]
+        ax.bar(positions, counts.to_numpy())
+        ax.set_xticks(positions, counts.index, rotation=45, ha='right')
+        ax.set_title(f'Bar Chart of {variable} (Distinct Households)')
+        ax.set_xlabel(variable)
+        ax.set_ylabel('Frequency (Distinct Households)')
+        plot_idx += 1
+
+    if "Pie Chart" in chart_types:
+        ax = axes[plot_idx]
+        ax.pie(counts.to_numpy(), labels=counts.index, autopct='%1.1f%%')
+        ax.set_title(f'Pie Chart of {variable} (Distinct Households)')
+        plot_idx += 1
+
+    fig.tight_layout()
+    buffer = BytesIO()
+    fig.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+
+def chart_cache_key(data_version, *parts):
+    """Cache key of a chart for one dataset version and selection"""
+    raw = '\x1f'.join(str(part) for part in (data_version,) + parts)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:24]
+
+
+chart_cache = SizedLRU(CHART_CACHE_MAX_BYTES)
+
+
+async def frequency_chart(key, freq_series, variable, chart_types):
+    """Cached chart bytes for a key, rendered in a worker thread when missing"""
+    chart = chart_cache.get(key)
+    if chart is None:
+        loop = asyncio.get_running_loop()
+        chart = await loop.run_in_executor(
+            _renderer, render_frequency_chart, freq_series, variable, list(chart_types)
+        )
+        chart_cache.put(key, chart)
+    return chart
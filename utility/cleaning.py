@@ -0,0 +1,493 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from utility.comparison import HOUSEHOLD_KEY
+from utility.cube import build_cube, update_cube
+from utility.helper import optimize_df, optimized_column
+from utility.loader import sheet_signature
+
+
+LGA_COLUMN = 'calc_l4_name'
+DUPLICATE_LABELS = ['', '⚠️ Duplicate']
+# Anchor rows remembered for recognising the next cumulative export
+MAX_ANCHORS = 12
+
+# A valid interview: household found, first-visit respondent present (or
+# returning) and consent given; a response matches if it contains any pattern
+VALIDITY_RULES = {
+    'HouseholdFound': ('yes',),
+    'FirstVisitPresent': ('yes', 'no_but_will_return'),
+    'Consent': ('yes',)
+}
+
+# Counts shown for an LGA without rows
+EMPTY_COVERAGE = {'rows': 0, 'distinct': 0, 'duplicates': 0, 'cross_lga': 0}
+
+
+def build_group_index(df, column):
+    """Row positions of every value of a column, e.g. LGA -> rows of that LGA"""
+    if column not in df.columns:
+        return {}
+    groups = df.groupby(column, observed=True, sort=False).indices
+    return {value: positions.astype(np.int64) for value, positions in groups.items()}
+
+
+def group_positions(group_index, value):
+    """Row positions for one value (empty when the value is unknown)"""
+    return group_index.get(value, np.array([], dtype=np.int64))
+
+
+def lga_codes(lga_index, n):
+    """LGA number of every row, in lga_index order (-1 for rows without an LGA)"""
+    codes = np.full(n, -1, dtype=np.int64)
+    for code, positions in enumerate(lga_index.values()):
+        codes[positions] = code
+    return codes
+
+
+def duplicate_groups(codes, has_id, row_lgas):
+    """Duplicate arrays from household group codes and LGA codes of every row"""
+    n = len(codes)
+    sizes = np.bincount(codes) if n else np.array([], dtype=np.int64)
+    is_first = np.zeros(n, dtype=bool)
+    is_first[np.unique(codes, return_index=True)[1]] = True
+
+    # Rows without an LGA do not make a household cross-LGA
+    located = row_lgas >= 0
+    pairs = np.unique(np.column_stack([codes[located], row_lgas[located]]), axis=0)
+    lgas_per_group = np.bincount(pairs[:, 0], minlength=len(sizes))
+    cross_lga = (lgas_per_group[codes] > 1) & has_id
+
+    return {
+        'group_id': codes.astype(np.int32),
+        'group_size': sizes[codes].astype(np.int32),
+        'is_first': is_first,
+        'is_duplicate': sizes[codes] > 1,
+        'cross_lga': cross_lga,
+        'has_id': has_id
+    }
+
+
+def build_duplicate_groups(df, lga_index=None, key=HOUSEHOLD_KEY):
+    """Duplicate structure of a household ID column, aligned to the frame's rows.
+
+    Every row gets the id and size of its household group and whether it is
+    the group's first occurrence; rows whose household also appears in
+    another LGA (per `lga_index`) are flagged as cross-LGA duplicates.
+    Missing IDs form a group of their own, as with DataFrame.duplicated, but
+    are never cross-LGA. 'ids' holds the household ID of every group code.
+    """
+    n = len(df)
+    if key not in df.columns:
+        return {
+            'group_id': np.arange(n, dtype=np.int32),
+            'group_size': np.ones(n, dtype=np.int32),
+            'is_first': np.ones(n, dtype=bool),
+            'is_duplicate': np.zeros(n, dtype=bool),
+            'cross_lga': np.zeros(n, dtype=bool),
+            'has_id': np.zeros(n, dtype=bool),
+            'ids': None
+        }
+
+    has_id = df[key].notna().to_numpy()
+    codes, uniques = pd.factorize(df[key], use_na_sentinel=False)
+    duplicates = duplicate_groups(codes, has_id, lga_codes(lga_index or {}, n))
+    duplicates['ids'] = pd.Index(uniques)
+    return duplicates
+
+
+def coverage_counts(duplicates, row_lgas, n_lgas):
+    """Submission counts per LGA and for all rows, as arrays.
+
+    Slot 0 holds rows without an LGA, then LGAs follow in lga_index order.
+    Every count is a sum over households, so the counts of a cumulative
+    export can be updated from the households that got new rows alone.
+    """
+    group_id = duplicates['group_id'].astype(np.int64)
+    has_id = duplicates['has_id']
+    cross_lga = duplicates['cross_lga']
+
+    # Distinct (LGA, household) pairs among rows that have a household ID
+    n_groups = int(group_id.max()) + 1 if len(group_id) else 0
+    pair_keys = np.unique((row_lgas[has_id] + 1) * n_groups + group_id[has_id])
+    pair_lga = pair_keys // max(n_groups, 1) - 1
+    pair_group = pair_keys % max(n_groups, 1)
+
+    per_lga = n_lgas + 1
+    group_cross = cross_lga_groups(cross_lga, group_id, n_groups)
+    all_ids = group_id[has_id]
+    return {
+        'rows': np.bincount(row_lgas + 1, minlength=per_lga),
+        'ids': np.bincount(row_lgas[has_id] + 1, minlength=per_lga),
+        'distinct': np.bincount(pair_lga + 1, minlength=per_lga),
+        'cross': np.bincount(pair_lga[group_cross[pair_group]] + 1, minlength=per_lga),
+        'all': np.array([len(group_id), len(all_ids), len(np.unique(all_ids)), int(group_cross.sum())])
+    }
+
+
+def moved_counts(counts, lga_positions, n_lgas):
+    """coverage_counts arrays laid out for another LGA order"""
+    slots = np.append(0, np.asarray(lga_positions, dtype=np.int64) + 1)
+    moved = {'all': counts['all']}
+    for key in ('rows', 'ids', 'distinct', 'cross'):
+        moved[key] = np.zeros(n_lgas + 1, dtype=np.int64)
+        moved[key][slots] = counts[key]
+    return moved
+
+
+def coverage_stats(duplicates, lga_index, counts=None):
+    """Submission counts for all rows and for every LGA from one pass.
+
+    Returns {'all': counts, 'lgas': {lga: counts}} where counts holds the
+    number of rows, distinct households, duplicate submissions (extra rows of
+    a repeated household) and households also submitted in another LGA.
+    `counts` are the coverage_counts of the upload when already known.
+    """
+    if counts is None:
+        counts = coverage_counts(duplicates, lga_codes(lga_index, len(duplicates['group_id'])), len(lga_index))
+    rows, ids, distinct, cross = counts['rows'], counts['ids'], counts['distinct'], counts['cross']
+
+    def lga_counts(code):
+        return {
+            'rows': int(rows[code]),
+            'distinct': int(distinct[code]),
+            'duplicates': int(ids[code] - distinct[code]),
+            'cross_lga': int(cross[code])
+        }
+
+    n_rows, n_ids, n_distinct, n_cross = (int(value) for value in counts['all'])
+    return {
+        'all': {
+            'rows': n_rows,
+            'distinct': n_distinct,
+            'duplicates': n_ids - n_distinct,
+            'cross_lga': n_cross
+        },
+        'lgas': {lga: lga_counts(code + 1) for code, lga in enumerate(lga_index)}
+    }
+
+
+def cross_lga_groups(cross_lga, group_id, n_groups):
+    """Boolean per household group: submitted in more than one LGA"""
+    flags = np.zeros(n_groups, dtype=bool)
+    flags[group_id[cross_lga]] = True
+    return flags
+
+
+def add_villagelist(df):
+    """Add the 'LGA Village' label column when both location columns exist"""
+    if 'calc_l4_name' in df.columns and 'calc_village_name' in df.columns:
+        l4_name = df['calc_l4_name'].astype(str).replace('nan', '')
+        village_name = df['calc_village_name'].astype(str).replace('nan', '')
+        df['Villagelist'] = l4_name + ' ' + village_name
+    return df
+
+
+def with_duplicate_status(df, duplicates):
+    """Frame with the Duplicate_Status column first"""
+    status = pd.Categorical.from_codes(duplicates['is_duplicate'].astype(np.int8), categories=DUPLICATE_LABELS)
+    df.insert(0, 'Duplicate_Status', status)
+    return df
+
+
+def response_matches(series, patterns):
+    """Rows whose response contains any of the patterns (case-insensitive).
+
+    Each distinct response is tested once and the result is looked up by
+    code, so no string is scanned per row.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, labels = series.cat.codes.to_numpy(), series.cat.categories
+    else:
+        codes, labels = pd.factorize(series)
+    # Numeric or mixed responses are matched by their text
+    responses = pd.Series(labels.astype(str))
+    matches = np.zeros(len(labels) + 1, dtype=bool)
+    for pattern in patterns:
+        matches[:-1] |= responses.str.contains(pattern, case=False, na=False).to_numpy(dtype=bool)
+    # Code -1 (missing) picks the trailing False
+    return matches[codes]
+
+
+def validity_mask(df, rules=VALIDITY_RULES):
+    """Boolean mask of valid interviews, or None when a response column is missing"""
+    if not all(column in df.columns for column in rules):
+        return None
+    valid = np.ones(len(df), dtype=bool)
+    for column, patterns in rules.items():
+        valid &= response_matches(df[column], patterns)
+    return valid
+
+
+def prepare_cleaning_frame(raw_df):
+    """Everything the cleaning tab needs from a freshly parsed upload.
+
+    Returns the display frame (sorted by household ID, Duplicate_Status
+    first, optimized dtypes), its duplicate groups, the LGA -> rows index,
+    the coverage counts (see coverage_counts), the household count cube (see
+    build_cube), the valid-interview mask (see validity_mask) and the
+    signature used to recognise the next cumulative export.
+    """
+    signature = sheet_signature(raw_df)
+    df = add_villagelist(raw_df)
+
+    # Sort first so the duplicate groups line up with the stored rows; a stable
+    # sort keeps each household's submissions in upload order
+    if HOUSEHOLD_KEY in df.columns:
+        df = df.sort_values(HOUSEHOLD_KEY, kind='stable')
+    lga_index = build_group_index(df, LGA_COLUMN)
+    duplicates = build_duplicate_groups(df, lga_index)
+    df = with_duplicate_status(df, duplicates)
+
+    # Optimize memory usage, reusing dtype choices from earlier uploads of this form
+    df = optimize_df(df, use_schema_cache=True)
+    row_lgas = lga_codes(lga_index, len(df))
+    return {
+        'df': df,
+        'duplicates': duplicates,
+        'lga_index': lga_index,
+        'coverage': coverage_counts(duplicates, row_lgas, len(lga_index)),
+        'cube': build_cube(df, duplicates, row_lgas, len(lga_index)),
+        'valid': validity_mask(df),
+        'signature': signature
+    }
+
+
+def append_rows(df, tail, names=None):
+    """Rows of `tail` appended to `df` (only the `names` columns, default all),
+    keeping df's dtypes where the new values fit"""
+    names = list(df.columns) if names is None else names
+    columns = []
+    for name in names:
+        old = df[name]
+        new = tail[name] if name in tail.columns else pd.Series(np.nan, index=tail.index)
+        combined = None
+        if isinstance(old.dtype, pd.CategoricalDtype):
+            try:
+                combined = union_categoricals([old.array, pd.Categorical(new)], ignore_order=True)
+            except TypeError:
+                # Categories of another type (e.g. numbers in a text column)
+                old = old.astype(object)
+        if combined is None:
+            combined = pd.concat([old, new], ignore_index=True)
+            if combined.dtype != old.dtype:
+                combined = optimized_column(combined)
+            combined = combined.array
+        columns.append(combined)
+
+    result = pd.DataFrame(dict(enumerate(columns)), copy=False)
+    result.columns = names
+    result.index = df.index.append(tail.index)
+    return result
+
+
+def merged_sort_order(sorted_keys, new_keys):
+    """Positions that stably sort `sorted_keys` (already sorted, missing last)
+    followed by `new_keys`, found by binary search instead of a full sort"""
+    n_old = len(sorted_keys)
+    n_old_present = int(sorted_keys.notna().sum())
+    new_order = new_keys.reset_index(drop=True).sort_values(kind='stable', na_position='last').index.to_numpy()
+    n_new_present = int(new_keys.notna().sum())
+
+    old_present = sorted_keys.iloc[:n_old_present].to_numpy(dtype=object)
+    new_present = new_keys.to_numpy(dtype=object)[new_order[:n_new_present]]
+    inserts = np.searchsorted(old_present, new_present, side='right')
+
+    # Present keys merged, then the old rows without a key, then the new ones
+    targets = np.concatenate([
+        inserts + np.arange(n_new_present),
+        n_old + n_new_present + np.arange(len(new_keys) - n_new_present)
+    ])
+    order = np.empty(n_old + len(new_keys), dtype=np.int64)
+    is_new = np.zeros(len(order), dtype=bool)
+    is_new[targets] = True
+    order[targets] = n_old + new_order
+    order[~is_new] = np.arange(n_old)
+    return order
+
+
+def extend_signature(signature, tail):
+    """Signature of the export after `tail` was appended to it"""
+    if signature is None:
+        return None
+    tail_signature = sheet_signature(tail)
+    if tail_signature is None:
+        return None
+    anchors = dict(signature['anchors'])
+    anchors.update({signature['rows'] + pos: key for pos, key in tail_signature['anchors'].items()})
+    # Keep the first and last anchors and an even spread in between
+    positions = sorted(anchors)
+    if len(positions) > MAX_ANCHORS:
+        keep = np.linspace(0, len(positions) - 1, MAX_ANCHORS).round().astype(int)
+        positions = [positions[i] for i in sorted(set(keep))]
+    return {
+        'header': signature['header'],
+        'rows': signature['rows'] + len(tail),
+        'anchors': {pos: anchors[pos] for pos in positions}
+    }
+
+
+def moved_group_index(group_index, where, tail_index, n_old):
+    """Group index of a merged frame: old rows moved to `where[position]`, and
+    the tail's rows (tail_index, positions counted from n_old) added"""
+    positions = {value: where[rows] for value, rows in group_index.items()}
+    for value, rows in tail_index.items():
+        moved = np.sort(where[rows + n_old])
+        if value in positions:
+            moved = np.sort(np.concatenate([positions[value], moved]), kind='stable')
+        positions[value] = moved
+    # Listed by first row, as groupby(sort=False) over the merged frame does
+    return dict(sorted(positions.items(), key=lambda item: item[1][0]))
+
+
+def appended_duplicates(previous, codes, has_id, row_lgas, touched, ids):
+    """Duplicate arrays of a merged frame where only `touched` households got rows.
+
+    Rows of a household are consecutive (the frame is sorted by household
+    ID), so first occurrences are where the group code changes, and only the
+    touched households need their LGAs compared for cross-LGA duplicates.
+    """
+    n_groups = len(ids)
+    sizes = np.bincount(codes, minlength=n_groups)
+    is_first = np.ones(len(codes), dtype=bool)
+    is_first[1:] = codes[1:] != codes[:-1]
+
+    group_cross = cross_lga_groups(previous['cross_lga'], previous['group_id'], n_groups)
+    rows = np.flatnonzero(touched[codes] & (row_lgas >= 0))
+    lowest = np.full(n_groups, np.iinfo(np.int64).max)
+    highest = np.full(n_groups, -1, dtype=np.int64)
+    np.minimum.at(lowest, codes[rows], row_lgas[rows])
+    np.maximum.at(highest, codes[rows], row_lgas[rows])
+    group_cross[touched] = highest[touched] > lowest[touched]
+
+    return {
+        'group_id': codes.astype(np.int32),
+        'group_size': sizes[codes].astype(np.int32),
+        'is_first': is_first,
+        'is_duplicate': sizes[codes] > 1,
+        'cross_lga': group_cross[codes] & has_id,
+        'has_id': has_id,
+        'ids': ids
+    }
+
+
+def duplicate_rows(duplicates, rows):
+    """Duplicate arrays of some rows (whole households, so the flags still hold)"""
+    return {key: duplicates[key][rows] for key in
+            ('group_id', 'group_size', 'is_first', 'is_duplicate', 'cross_lga', 'has_id')}
+
+
+def append_cleaning_frame(state, raw_tail):
+    """Cleaning state of a cumulative export from the previous state and its new rows.
+
+    Only the new rows are labelled and factorised: their household IDs are
+    looked up among the known groups, and they are merged into the sorted
+    order by binary search. The stored rows are not parsed, re-sorted or
+    re-optimized. Coverage counts and the count cube are updated from the
+    households that got new rows (their old rows out, all their rows in);
+    what remains proportional to the whole export is moving the stored
+    columns and flag arrays into the merged order.
+    """
+    if len(raw_tail) == 0:
+        return dict(state, appended=0)
+
+    df = state['df']
+    previous = state['duplicates']
+    signature = extend_signature(state.get('signature'), raw_tail)
+    tail = add_villagelist(raw_tail)
+    n_old = len(df)
+
+    body = append_rows(df, tail, [name for name in df.columns if name != 'Duplicate_Status'])
+    n = len(body)
+    tail_valid = validity_mask(body.iloc[n_old:])
+
+    if HOUSEHOLD_KEY not in df.columns or previous['ids'] is None or 'cube' not in state:
+        lga_index = build_group_index(body, LGA_COLUMN)
+        duplicates = build_duplicate_groups(body, lga_index)
+        df = with_duplicate_status(body, duplicates)
+        row_lgas = lga_codes(lga_index, n)
+        return {
+            'df': df,
+            'duplicates': duplicates,
+            'lga_index': lga_index,
+            'coverage': coverage_counts(duplicates, row_lgas, len(lga_index)),
+            'cube': build_cube(df, duplicates, row_lgas, len(lga_index)),
+            'valid': validity_mask(df),
+            'signature': signature,
+            'appended': n - n_old
+        }
+
+    new_keys = tail[HOUSEHOLD_KEY]
+    # Raises TypeError for IDs of mixed types, which need a full reload
+    order = merged_sort_order(df[HOUSEHOLD_KEY], new_keys)
+    where = np.empty(n, dtype=np.int64)
+    where[order] = np.arange(n)
+
+    # Known households keep their group code, new ones get the next codes
+    ids = previous['ids']
+    new_codes = ids.get_indexer(new_keys)
+    # Missing IDs are one group, however the missing value is spelled
+    missing_code = np.flatnonzero(ids.isna())
+    if len(missing_code):
+        new_codes[new_keys.isna().to_numpy()] = missing_code[0]
+    unseen = new_codes < 0
+    if unseen.any():
+        codes, uniques = pd.factorize(new_keys[unseen], use_na_sentinel=False)
+        new_codes[unseen] = len(ids) + codes
+        ids = ids.append(pd.Index(uniques))
+
+    # Households with new rows; every other household keeps its rows and counts
+    touched = np.zeros(len(ids), dtype=bool)
+    touched[new_codes] = True
+    old_rows = np.flatnonzero(touched[previous['group_id']])
+
+    codes = np.concatenate([previous['group_id'], new_codes])[order]
+    has_id = np.concatenate([previous['has_id'], new_keys.notna().to_numpy()])[order]
+    tail_index = build_group_index(body.iloc[n_old:], LGA_COLUMN)
+    lga_index = moved_group_index(state['lga_index'], where, tail_index, n_old)
+    row_lgas = lga_codes(lga_index, n)
+    duplicates = appended_duplicates(previous, codes, has_id, row_lgas, touched, ids)
+    merged = with_duplicate_status(body.take(order), duplicates)
+    new_rows = np.flatnonzero(touched[codes])
+
+    old_lgas = list(state['lga_index'])
+    old_row_lgas = lga_codes(state['lga_index'], n_old)[old_rows]
+    removed = duplicate_rows(previous, old_rows)
+    added = duplicate_rows(duplicates, new_rows)
+    lgas = list(lga_index)
+    lga_position = {lga: i for i, lga in enumerate(lgas)}
+    old_positions = [lga_position[lga] for lga in old_lgas]
+
+    counts = state.get('coverage')
+    if counts is None:
+        counts = coverage_counts(previous, lga_codes(state['lga_index'], n_old), len(old_lgas))
+    counts = moved_counts(counts, old_positions, len(lgas))
+    removed_counts = moved_counts(coverage_counts(removed, old_row_lgas, len(old_lgas)), old_positions, len(lgas))
+    added_counts = coverage_counts(added, row_lgas[new_rows], len(lgas))
+    coverage = {key: counts[key] - removed_counts[key] + added_counts[key] for key in counts}
+
+    columns = list(state['cube'])
+    cube = update_cube(
+        state['cube'], old_lgas,
+        build_cube(df.iloc[old_rows], removed, old_row_lgas, len(old_lgas), columns=columns),
+        build_cube(merged.iloc[new_rows], added, row_lgas[new_rows], len(lgas), columns=columns),
+        lgas, merged
+    )
+
+    valid = None
+    if state.get('valid') is not None and tail_valid is not None:
+        valid = np.concatenate([state['valid'], tail_valid])[order]
+    elif tail_valid is not None:
+        valid = validity_mask(merged)
+
+    return {
+        'df': merged,
+        'duplicates': duplicates,
+        'lga_index': lga_index,
+        'coverage': coverage,
+        'cube': cube,
+        'valid': valid,
+        'signature': signature,
+        'appended': n - n_old
+    }
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+
+
+HOUSEHOLD_KEY = 'calc_household_id'
+CONTEXT_COLUMNS = ['calc_l4_name', 'calc_village_name']
+DUPLICATE_RULES = ('all', 'first', 'last')
+MATCH_LABELS = np.array(['❌ No', '✅ Yes'], dtype=object)
+SCORE_LABELS = np.array(['-1', '+1'], dtype=object)
+
+
+def normalize_values(series):
+    """Lower-case and strip a whole column at once, flagging missing values.
+
+    Values are written as str() writes each of them, so 3 and 3.0 differ as
+    they did when rows were compared one at a time.
+    """
+    missing = series.isna().to_numpy()
+    if pd.api.types.is_datetime64_any_dtype(series.dtype) or isinstance(series.dtype, pd.PeriodDtype):
+        # A datetime column writes dates without a time; str(Timestamp) always has one
+        series = series.astype(object)
+    text = series.astype(str).str.lower().str.strip().to_numpy(dtype=object)
+    return text, missing
+
+
+def match_mask(values1, values2):
+    """Boolean match array for two aligned columns (NaN == NaN counts as a match)"""
+    text1, missing1 = normalize_values(values1)
+    text2, missing2 = normalize_values(values2)
+    both_present = ~missing1 & ~missing2
+    same_text = np.zeros(len(text1), dtype=bool)
+    same_text[both_present] = text1[both_present] == text2[both_present]
+    return (missing1 & missing2) | same_text
+
+
+def village_labels(merged_df):
+    """'LGA - Village' label for every merged row, or 'N/A' when unavailable"""
+    if 'calc_l4_name' in merged_df.columns and 'calc_village_name' in merged_df.columns:
+        return (merged_df['calc_l4_name'].astype(str) + ' - '
+                + merged_df['calc_village_name'].astype(str)).to_numpy(dtype=object)
+    return np.full(len(merged_df), 'N/A', dtype=object)
+
+
+def merge_for_comparison(main_df, revisit_df, variables, duplicates='all'):
+    """Merge main and revisit data once on the household ID.
+
+    Only the household ID, location columns and the variables present in
+    both frames are projected before the merge. Repeated revisit household
+    IDs are handled by `duplicates`: 'all' keeps every main/revisit pair,
+    'first' or 'last' keeps a single revisit row per household.
+    Returns the merged frame and the list of variables it compares.
+    """
+    if duplicates not in DUPLICATE_RULES:
+        raise ValueError(f"Unknown duplicate rule: {duplicates}")
+
+    variables = [var for var in variables if var in main_df.columns and var in revisit_df.columns]
+    main_cols = [HOUSEHOLD_KEY] + [col for col in CONTEXT_COLUMNS if col in main_df.columns] + variables
+    main_cols = list(dict.fromkeys(main_cols))
+
+    revisit = revisit_df[[HOUSEHOLD_KEY] + variables]
+    if duplicates != 'all':
+        revisit = revisit.drop_duplicates(subset=[HOUSEHOLD_KEY], keep=duplicates)
+
+    merged_df = pd.merge(
+        main_df[main_cols],
+        revisit,
+        on=HOUSEHOLD_KEY,
+        how='inner',
+        suffixes=('_1', '_2')
+    )
+    return merged_df, variables
+
+
+def compare_variables(main_df, revisit_df, variables, duplicates='all'):
+    """Compare main and revisit data per variable.
+
+    Returns a (counts, detail) pair: counts has one row per compared variable
+    with its number of matches and records, detail has one row per compared
+    household value as shown in the Detailed Comparison table.
+    """
+    merged_df, variables = merge_for_comparison(main_df, revisit_df, variables, duplicates)
+    villages = village_labels(merged_df)
+    household_ids = merged_df[HOUSEHOLD_KEY].to_numpy()
+
+    counts = []
+    details = []
+
+    for var in variables:
+        values1 = merged_df[f"{var}_1"]
+        values2 = merged_df[f"{var}_2"]
+        matches = match_mask(values1, values2)
+
+        counts.append({
+            'Variable': var,
+            'Matches': int(matches.sum()),
+            'Total': len(merged_df)
+        })
+        details.append(pd.DataFrame({
+            'Variable': var,
+            'Village': villages,
+            'Household ID': household_ids,
+            'Main': values1.to_numpy(dtype=object),
+            'Revisit': values2.to_numpy(dtype=object),
+            'Match': MATCH_LABELS[matches.astype(np.int8)],
+            'Score': SCORE_LABELS[matches.astype(np.int8)]
+        }))
+
+    counts_df = pd.DataFrame(counts, columns=['Variable', 'Matches', 'Total'])
+    if details:
+        detail_df = pd.concat(details, ignore_index=True)
+    else:
+        detail_df = pd.DataFrame(
+            columns=['Variable', 'Village', 'Household ID', 'Main', 'Revisit', 'Match', 'Score']
+        )
+    return counts_df, detail_df
@@ -0,0 +1,240 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from utility.helper import CARDINALITY_SAMPLE
+from utility.pivot import observed_codes
+
+
+# Text columns with more distinct values than this are left to the raw frame
+CUBE_MAX_VALUES = int(os.environ.get('PDM_CUBE_MAX_VALUES', '1000'))
+# Rows looked back for an earlier submission of the same household
+MAX_LOOKBACK = 16
+
+
+def distinct_first(groups, keys, mask, repeated, adjacent=False):
+    """Rows (within mask) that are the first of their household and key values.
+
+    keys is a list of (codes, size) pairs with codes in [-1, size - 1]. Only
+    rows of households submitted more than once (`repeated`) can share a
+    combination with an earlier row, so only those are searched. With
+    adjacent=True each household's rows are consecutive (the frame is sorted
+    by household ID), so an earlier row with the same combination is at
+    most a few rows back and is found without sorting or hashing.
+    """
+    first = mask.copy()
+    rows = np.flatnonzero(mask & repeated)
+    if len(rows) == 0:
+        return first
+    combined = groups[rows].astype(np.int64)
+    for codes, size in keys:
+        combined = combined * (size + 1) + (codes[rows] + 1)
+
+    if adjacent:
+        household = groups[rows]
+        seen = np.zeros(len(rows), dtype=bool)
+        for back in range(1, MAX_LOOKBACK + 1):
+            same_household = household[back:] == household[:-back]
+            if not same_household.any():
+                first[rows] = ~seen
+                return first
+            seen[back:] |= same_household & (combined[back:] == combined[:-back])
+
+    # Households with very many rows (or not sorted): hash the combined codes
+    first[rows] = ~pd.Series(combined).duplicated().to_numpy()
+    return first
+
+
+def few_values(series, max_values):
+    """Cheap pre-check that a text column has at most max_values distinct values"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return len(series.cat.categories) <= max_values
+    sample = series.to_numpy()[:CARDINALITY_SAMPLE]
+    return pd.unique(sample).size <= max_values
+
+
+def build_cube(df, duplicates, row_lgas, n_lgas, max_values=None, columns=None):
+    """Household counts by (LGA, value) for every text/categorical column.
+
+    For each column with at most max_values distinct values the cube holds:
+    rows       submissions per (LGA, value)
+    households distinct households per (LGA, value), plus 'lga_households',
+               'value_households' and 'total_households' for the margins
+    first      per (LGA, value) and, in the last row, per value for all rows:
+               households whose first submission (in that LGA / overall) has
+               that value, as counted by the frequency table
+    Missing values and household IDs are left out, except that rows without
+    an ID count as one household in 'first', like DataFrame.drop_duplicates.
+    Given `columns`, exactly those are counted, whatever their cardinality.
+    """
+    max_values = CUBE_MAX_VALUES if max_values is None else max_values
+    groups = duplicates['group_id']
+    has_id = duplicates['has_id']
+    repeated = duplicates['is_duplicate']
+    located = row_lgas >= 0
+    lga_key = (row_lgas, n_lgas)
+    # Rows of a household are consecutive when each group is one run of rows
+    adjacent = len(groups) > 0 and np.count_nonzero(np.diff(groups)) + 1 == int(duplicates['is_first'].sum())
+
+    # First submission of every household within its LGA, shared by all columns
+    first_in_lga = distinct_first(groups, [lga_key], located, repeated, adjacent)
+
+    names = df.select_dtypes(include=['object', 'category']).columns if columns is None else columns
+    cube = {}
+    for name in names:
+        if columns is None and not few_values(df[name], max_values):
+            continue
+        try:
+            codes, labels = observed_codes(df[name])
+        except TypeError:
+            # Values of mixed types cannot be ordered
+            continue
+        n_values = len(labels)
+        if columns is None and n_values > max_values:
+            continue
+
+        present = codes >= 0
+        counted = present & located
+        with_id = counted & has_id
+        cells = row_lgas * n_values + codes
+        n_cells = n_lgas * n_values
+
+        pairs = distinct_first(groups, [lga_key, (codes, n_values)], with_id, repeated, adjacent)
+        per_lga = distinct_first(groups, [lga_key], with_id, repeated, adjacent)
+        per_value = distinct_first(groups, [(codes, n_values)], with_id, repeated, adjacent)
+        overall = distinct_first(groups, [], with_id, repeated, adjacent)
+
+        first = np.zeros((n_lgas + 1, n_values), dtype=np.int64)
+        first[:n_lgas] = np.bincount(cells[first_in_lga & present], minlength=n_cells).reshape(n_lgas, n_values)
+        first[n_lgas] = np.bincount(codes[duplicates['is_first'] & present], minlength=n_values)
+
+        cube[name] = {
+            'labels': pd.Index(labels),
+            'rows': np.bincount(cells[counted], minlength=n_cells).reshape(n_lgas, n_values),
+            'households': np.bincount(cells[pairs], minlength=n_cells).reshape(n_lgas, n_values),
+            'lga_households': np.bincount(row_lgas[per_lga], minlength=n_lgas),
+            'value_households': np.bincount(codes[per_value], minlength=n_values),
+            'total_households': int(overall.sum()),
+            'first': first
+        }
+    return cube
+
+
+def ordered_labels(series, labels):
+    """labels in the order observed_codes gives them for the whole column"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories
+        return categories[categories.isin(labels)]
+    return labels.sort_values()
+
+
+def moved_entry(entry, lga_positions, n_lgas, labels):
+    """One column's cube arrays laid out for another LGA order and label set"""
+    values = labels.get_indexer(entry['labels'])
+    lgas = np.asarray(lga_positions, dtype=np.int64)
+    moved = {}
+    for name in ('rows', 'households'):
+        grid = np.zeros((n_lgas, len(labels)), dtype=np.int64)
+        grid[np.ix_(lgas, values)] = entry[name]
+        moved[name] = grid
+    moved['lga_households'] = np.zeros(n_lgas, dtype=np.int64)
+    moved['lga_households'][lgas] = entry['lga_households']
+    moved['value_households'] = np.zeros(len(labels), dtype=np.int64)
+    moved['value_households'][values] = entry['value_households']
+    moved['total_households'] = entry['total_households']
+    first = np.zeros((n_lgas + 1, len(labels)), dtype=np.int64)
+    first[np.ix_(np.append(lgas, n_lgas), values)] = entry['first']
+    moved['first'] = first
+    return moved
+
+
+def update_cube(cube, cube_lgas, removed, added, lgas, df, max_values=None):
+    """The cube after some households got new rows: cube - removed + added.
+
+    Every count in the cube is a sum over households, so those households are
+    taken out with the counts of their old rows (`removed`, laid out like
+    `cube` by `cube_lgas`) and put back with the counts of all their rows now
+    (`added`, laid out by `lgas`, the LGAs of `df`, the new frame). The other
+    households are not looked at. Columns that can no longer be counted (too
+    many values, or values that cannot be ordered) are dropped.
+    """
+    max_values = CUBE_MAX_VALUES if max_values is None else max_values
+    n_lgas = len(lgas)
+    lga_position = {lga: i for i, lga in enumerate(lgas)}
+    old_positions = [lga_position[lga] for lga in cube_lgas]
+    new_positions = list(range(n_lgas))
+
+    updated = {}
+    for name, entry in cube.items():
+        if name not in removed or name not in added:
+            continue
+        try:
+            labels = ordered_labels(df[name], entry['labels'].append(added[name]['labels']).unique())
+        except TypeError:
+            continue
+        if len(labels) > max_values:
+            continue
+
+        base = moved_entry(entry, old_positions, n_lgas, labels)
+        old = moved_entry(removed[name], old_positions, n_lgas, labels)
+        new = moved_entry(added[name], new_positions, n_lgas, labels)
+        updated[name] = {key: base[key] - old[key] + new[key] for key in base}
+        updated[name]['total_households'] = int(updated[name]['total_households'])
+        updated[name]['labels'] = labels
+    return updated
+
+
+def cube_frequencies(cube, column, lga_position=None):
+    """Distinct-household value counts of a column, most frequent first.
+
+    lga_position is the LGA's position in the cleaning state's LGA index, or
+    None for all rows. Returns None when the column is not in the cube.
+    """
+    entry = cube.get(column)
+    if entry is None:
+        return None
+    counts = entry['first'][-1 if lga_position is None else lga_position]
+    order = np.argsort(-counts, kind='stable')
+    order = order[counts[order] > 0]
+    return pd.Series(counts[order], index=entry['labels'][order], name='count')
+
+
+def cube_pivot(cube, lgas, lga_column, index, columns):
+    """Count and distinct-household tables for an LGA x column pivot, from the cube.
+
+    Returns the same (row labels, column labels, {aggregate: 2-D array})
+    triple as pivot_cells, or None when the cube cannot answer the pivot.
+    """
+    if index == lga_column and columns != lga_column:
+        entry, transpose = cube.get(columns), False
+    elif columns == lga_column and index != lga_column:
+        entry, transpose = cube.get(index), True
+    else:
+        return None
+    if entry is None:
+        return None
+
+    # LGAs without rows for this column are still listed, in label order
+    order = np.argsort(np.array([str(lga) for lga in lgas]), kind='stable')
+    lga_labels = pd.Index([lgas[i] for i in order])
+    rows = entry['rows'][order]
+    households = entry['households'][order]
+    lga_households = entry['lga_households'][order]
+
+    n_lgas, n_values = rows.shape
+    count = np.zeros((n_lgas + 1, n_values + 1))
+    count[:n_lgas, :n_values] = rows
+    count[:n_lgas, n_values] = rows.sum(axis=1)
+    count[n_lgas, :n_values] = rows.sum(axis=0)
+    count[n_lgas, n_values] = rows.sum()
+
+    distinct = np.zeros((n_lgas + 1, n_values + 1))
+    distinct[:n_lgas, :n_values] = households
+    distinct[:n_lgas, n_values] = lga_households
+    distinct[n_lgas, :n_values] = entry['value_households']
+    distinct[n_lgas, n_values] = entry['total_households']
+
+    if transpose:
+        return entry['labels'], lga_labels, {'count': count.T, 'households': distinct.T}
+    return lga_labels, entry['labels'], {'count': count, 'households': distinct}
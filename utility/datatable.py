@@ -0,0 +1,180 @@
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from starlette.responses import JSONResponse
+
+
+# Tables with more rows than this are served page by page
+SERVER_SIDE_MIN_ROWS = int(os.environ.get('PDM_SERVER_SIDE_MIN_ROWS', '5000'))
+# Search results remembered per table
+SEARCH_CACHE_SIZE = 8
+# Above this many occurrences of a term its values are matched in one vectorised pass
+MAX_FIND_MATCHES = 20000
+
+# Search indexes are built off the event loop while the first page is shown
+_indexer = ThreadPoolExecutor(max_workers=1)
+
+
+def value_text(labels):
+    """Text of distinct values as str() writes each of them, like the table pages"""
+    if isinstance(labels, pd.DatetimeIndex) and labels.tz is None:
+        values = labels.to_numpy()
+        # Whole seconds are written the same way without a Timestamp per value
+        if (values.astype('datetime64[s]') == values).all():
+            return pd.Series(np.datetime_as_string(values, unit='s')).str.replace('T', ' ', regex=False)
+    return pd.Series(np.asarray(labels, dtype=object)).astype(str)
+
+
+def build_search_index(df):
+    """Lower-cased text of every column's distinct values, as the table shows them.
+
+    The texts of all columns are joined into one string, so a term is found
+    with str.find over the distinct values rather than per row. Each column
+    keeps the codes of its rows into its slice of the values (-1: missing).
+    """
+    pieces = []
+    columns = []
+    for col_idx in range(df.shape[1]):
+        column = df.iloc[:, col_idx]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            codes, labels = column.cat.codes.to_numpy(), column.cat.categories
+        else:
+            codes, labels = pd.factorize(column)
+        text = value_text(labels).str.lower()
+        text = text.str.replace('\x00', '', regex=False).tolist()
+        columns.append((codes, len(pieces), len(pieces) + len(text)))
+        pieces.extend(text)
+    lengths = np.fromiter((len(piece) + 1 for piece in pieces), dtype=np.int64, count=len(pieces))
+    return {
+        'text': '\x00'.join(pieces),
+        'starts': np.cumsum(lengths) - lengths,
+        'columns': columns
+    }
+
+
+def matching_values(index, term):
+    """Which distinct values of a search index contain the (lower-cased) term"""
+    text, starts = index['text'], index['starts']
+    hits = np.zeros(len(starts), dtype=bool)
+    count = text.count(term)
+    if count == 0:
+        return hits
+    if count > MAX_FIND_MATCHES:
+        hits[:] = pd.Series(text.split('\x00')).str.contains(term, regex=False).to_numpy(dtype=bool)
+        return hits
+    positions = []
+    position = text.find(term)
+    while position >= 0:
+        positions.append(position)
+        position = text.find(term, position + 1)
+    hits[np.searchsorted(starts, positions, side='right') - 1] = True
+    return hits
+
+
+class ServerTable:
+    """A DataFrame answering DataTables server-side processing requests.
+
+    Sort orders are computed once per (column, direction) and reused, so a
+    page request without a search term only touches the rows of that page.
+    Searches go through a search index (see build_search_index) built once
+    per table, and their results are cached per term.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.table_id = uuid.uuid4().hex
+        self.sort_orders = {}
+        self.searches = OrderedDict()
+        self.lock = threading.Lock()
+        self.search_index = _indexer.submit(build_search_index, df)
+
+    def sort_order(self, col_idx, ascending):
+        """Row positions sorted by one column (missing values last)"""
+        key = (col_idx, ascending)
+        with self.lock:
+            if key in self.sort_orders:
+                return self.sort_orders[key]
+        column = self.df.iloc[:, col_idx].reset_index(drop=True)
+        try:
+            ordered = column.sort_values(ascending=ascending, kind='stable', na_position='last')
+        except TypeError:
+            # Mixed types cannot be compared; sort on their text instead
+            ordered = column.astype(str).sort_values(ascending=ascending, kind='stable')
+        order = ordered.index.to_numpy()
+        with self.lock:
+            self.sort_orders[key] = order
+        return order
+
+    def search_mask(self, term):
+        """Rows where any column contains the term (case-insensitive)"""
+        with self.lock:
+            if term in self.searches:
+                self.searches.move_to_end(term)
+                return self.searches[term]
+        index = self.search_index.result()
+        hits = matching_values(index, term.lower())
+        mask = np.zeros(len(self.df), dtype=bool)
+        for codes, start, stop in index['columns']:
+            column_hits = hits[start:stop]
+            if column_hits.any():
+                # Code -1 (missing) picks the trailing False
+                mask |= np.append(column_hits, False)[codes]
+        with self.lock:
+            self.searches[term] = mask
+            while len(self.searches) > SEARCH_CACHE_SIZE:
+                self.searches.popitem(last=False)
+        return mask
+
+    def page(self, draw, start, length, search='', order_column=None, ascending=True):
+        """One DataTables response: the requested page after search and sort"""
+        total = len(self.df)
+        if order_column is not None and 0 <= order_column < self.df.shape[1]:
+            positions = self.sort_order(order_column, ascending)
+        else:
+            positions = None
+
+        if search:
+            mask = self.search_mask(search)
+            positions = np.flatnonzero(mask) if positions is None else positions[mask[positions]]
+            filtered = len(positions)
+        else:
+            filtered = total
+
+        stop = filtered if length < 0 else min(start + length, filtered)
+        if positions is None:
+            rows = np.arange(start, stop)
+        else:
+            rows = positions[start:stop]
+
+        page_df = self.df.iloc[rows]
+        values = page_df.astype(object).where(page_df.notna(), '').astype(str)
+        return {
+            'draw': draw,
+            'recordsTotal': total,
+            'recordsFiltered': filtered,
+            'data': values.to_numpy().tolist()
+        }
+
+
+def table_page_response(request, tables):
+    """Answer a DataTables server-side request for a table in `tables` (by ?table=)"""
+    params = request.query_params
+    table = tables.get(params.get('table', ''))
+    if table is None:
+        return JSONResponse({'error': 'The table has been refreshed, please reload it.'}, status_code=404)
+    try:
+        draw = int(params.get('draw', '0'))
+        start = max(0, int(params.get('start', '0')))
+        length = int(params.get('length', '25'))
+        order_column = params.get('order[0][column]')
+        order_column = int(order_column) if order_column is not None else None
+    except ValueError:
+        return JSONResponse({'error': 'Invalid paging parameters'}, status_code=400)
+    ascending = params.get('order[0][dir]', 'asc') != 'desc'
+    search = params.get('search[value]', '').strip()
+    return JSONResponse(table.page(draw, start, length, search, order_column, ascending))
@@ -0,0 +1,79 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from utility.cleaning import group_positions
+from utility.cube import cube_frequencies
+
+
+# Value counts remembered per upload, by (LGA, valid only, variable)
+FREQUENCY_CACHE_SIZE = 64
+
+
+class FrequencyService:
+    """Distinct-household value counts of one cleaning upload.
+
+    Each household counts once, with the value of its first submission in
+    the selection (as DataFrame.drop_duplicates on the household ID would).
+    The first-submission rows of every selection are computed once, and
+    only the selected column is counted at those rows. Results are cached
+    per (LGA, valid only, variable), so the frequency table and chart share
+    one computation.
+    """
+
+    def __init__(self, state, max_entries=FREQUENCY_CACHE_SIZE):
+        self.state = state
+        self.max_entries = max_entries
+        self.firsts = {}
+        self.counts = OrderedDict()
+        self.lock = threading.Lock()
+
+    def first_positions(self, lga=None, valid_only=False):
+        """Row of the first submission of every household in the selection"""
+        key = (lga, valid_only)
+        with self.lock:
+            if key in self.firsts:
+                return self.firsts[key]
+
+        duplicates = self.state['duplicates']
+        positions = None if lga is None else group_positions(self.state['lga_index'], lga)
+        valid = self.state.get('valid') if valid_only else None
+        if valid is not None:
+            positions = np.flatnonzero(valid) if positions is None else positions[valid[positions]]
+        if positions is None:
+            first = np.flatnonzero(duplicates['is_first'])
+        else:
+            groups = duplicates['group_id'][positions]
+            first = positions[np.sort(np.unique(groups, return_index=True)[1])]
+
+        with self.lock:
+            self.firsts[key] = first
+        return first
+
+    def frequencies(self, variable, lga=None, valid_only=False):
+        """Value counts of a column over distinct households, most frequent first"""
+        key = (lga, valid_only, variable)
+        with self.lock:
+            if key in self.counts:
+                self.counts.move_to_end(key)
+                return self.counts[key]
+
+        counts = None
+        if not valid_only or self.state.get('valid') is None:
+            # Counts over all rows of a text column were precomputed at upload
+            lgas = list(self.state['lga_index'])
+            if lga is None or lga in lgas:
+                position = None if lga is None else lgas.index(lga)
+                counts = cube_frequencies(self.state.get('cube', {}), variable, position)
+        if counts is None:
+            column = self.state['df'][variable]
+            counts = column.iloc[self.first_positions(lga, valid_only)].value_counts()
+            # Unused categories are left out, as in the cube's counts
+            counts = counts[counts > 0]
+
+        with self.lock:
+            self.counts[key] = counts
+            while len(self.counts) > self.max_entries:
+                self.counts.popitem(last=False)
+        return counts
@@ -0,0 +1,305 @@
+from shiny import App, ui, render, reactive
+import hashlib
+import json
+import os
+import pandas as pd
+import numpy as np
+from utility import loader
+
+
+def my_css():
+    return ui.tags.style("""
+        /* Overall app background and text styling */
+        body {
+            background-color: white;
+            color: #333;
+            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+        }
+
+        /* Header styling */
+        .app-header {
+            background-color: #2ec6f8;
+            color: white;
+            padding: 5px;
+            margin-bottom: 5px;
+            border-radius: 0 0 10px 10px;
+            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+        }
+
+        /* Card styling */
+        .card {
+            background-color: white;
+            border: none;
+            border-radius: 8px;
+            box-shadow: 0 2px 4px rgba(0,0,0,0.05);
+            margin-bottom: 20px;
+        }
+
+        .card-header {
+            background-color: #2ec6f8;
+            color: white;
+            border-radius: 8px 8px 0 0 !important;
+            padding: 15px 20px;
+        }
+
+        /* Sidebar styling */
+        .sidebar {
+            background-color: white;
+            border-radius: 8px;
+            box-shadow: 0 2px 4px rgba(0,0,0,0.05);
+            padding: 20px;
+        }
+
+        /* Tab styling */
+        .nav-tabs .nav-link {
+            color: #2c3e50;
+        }
+
+        .nav-tabs .nav-link.active {
+            color: #2ec6f8;
+            border-bottom: 2px solid #2980b9;
+        }
+
+        /* Accordion styling */
+        .accordion-button {
+            background-color: #2ec6f8;
+            color: white;
+        }
+
+        .accordion-button:not(.collapsed) {
+            background-color: #2ec6f8;
+            color: white;
+        }
+
+        /* Table styling */
+        .dataTable {
+            background-color: white;
+            border-radius: 8px;
+        }
+
+        /* Button styling */
+        .btn-primary {
+            background-color: #2980b9;
+            border-color: #2980b9;
+        }
+
+        .btn-primary:hover {
+            background-color: #2c3e50;
+            border-color: #2c3e50;
+        }
+    """)
+
+
+# Candidate integer types, smallest first
+SIGNED_INTS = [np.int8, np.int16, np.int32, np.int64]
+UNSIGNED_INTS = [np.uint8, np.uint16, np.uint32, np.uint64]
+
+# Rows sampled to estimate how many distinct values a string column has
+CARDINALITY_SAMPLE = 10000
+CATEGORY_RATIO = 0.5
+
+
+def smallest_int_dtype(lo, hi, nullable=False):
+    """Smallest integer dtype holding [lo, hi]; a pandas nullable dtype if nullable"""
+    candidates = UNSIGNED_INTS if lo >= 0 else SIGNED_INTS
+    for int_type in candidates:
+        info = np.iinfo(int_type)
+        if info.min <= lo and hi <= info.max:
+            name = np.dtype(int_type).name
+            return name.capitalize().replace('Uint', 'UInt') if nullable else name
+    return None
+
+
+def estimate_unique_ratio(values):
+    """Share of distinct values, estimated from a fixed sample of large columns"""
+    n = len(values)
+    if n > CARDINALITY_SAMPLE:
+        positions = np.random.default_rng(0).choice(n, CARDINALITY_SAMPLE, replace=False)
+        values = values[positions]
+    return pd.unique(values).size / len(values)
+
+
+def optimized_column(series, keep_floats=False):
+    """Return the column converted to its smallest lossless dtype (or unchanged)"""
+    dtype = series.dtype
+
+    if pd.api.types.is_integer_dtype(dtype) and not isinstance(dtype, pd.CategoricalDtype):
+        if series.count() == 0:
+            return series
+        target = smallest_int_dtype(int(series.min()), int(series.max()), nullable=not isinstance(dtype, np.dtype))
+        return series.astype(target) if target and target != dtype.name else series
+
+    if dtype == 'float64' or dtype == 'float32':
+        if keep_floats:
+            return series
+        values = series.to_numpy()
+        present = values[~np.isnan(values)]
+        if len(present) == 0:
+            return series
+        lo, hi = present.min(), present.max()
+        # Whole numbers (IDs, counts) become the smallest (nullable) integer type
+        if np.all(np.mod(present, 1) == 0) and -2**63 <= lo and hi < 2**63:
+            target = smallest_int_dtype(int(lo), int(hi), nullable=len(present) < len(values))
+            if target:
+                return series.astype(target)
+        # Only narrow to float32 when every value survives the round trip
+        if dtype == 'float64':
+            narrowed = values.astype(np.float32)
+            if np.array_equal(narrowed.astype(np.float64), values, equal_nan=True):
+                return pd.Series(narrowed, index=series.index, name=series.name)
+        return series
+
+    if dtype == 'object':
+        values = series.to_numpy()
+        if len(values) and estimate_unique_ratio(values) < CATEGORY_RATIO:
+            return series.astype('category')
+        return series
+
+    return series
+
+
+# dtype plans of previously seen column layouts, keyed by schema fingerprint
+schema_plans = {}
+
+
+def schema_fingerprint(columns, keep_floats=False):
+    """Short hash identifying a column layout (e.g. one KoBo form version)"""
+    raw = '\x1f'.join(map(str, columns))
+    if keep_floats:
+        # Plans that leave floats alone are kept apart from the others
+        raw += '\x1ekeep_floats'
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def schema_plan_path(fingerprint):
+    # Read at call time, so the plans follow the upload cache wherever it is set
+    return os.path.join(loader.CACHE_DIR, f"schema-{fingerprint}.json")
+
+
+def load_schema_plan(fingerprint):
+    """Cached column -> dtype plan for a layout, from memory or disk"""
+    if fingerprint not in schema_plans:
+        try:
+            with open(schema_plan_path(fingerprint), encoding='utf-8') as f:
+                schema_plans[fingerprint] = json.load(f)
+        except (OSError, ValueError):
+            return None
+    return schema_plans[fingerprint]
+
+
+def save_schema_plan(fingerprint, plan):
+    schema_plans[fingerprint] = plan
+    try:
+        os.makedirs(loader.CACHE_DIR, exist_ok=True)
+        with open(schema_plan_path(fingerprint), 'w', encoding='utf-8') as f:
+            json.dump(plan, f, default=str)
+    except OSError as e:
+        print(f"Error saving dtype plan: {str(e)}")
+
+
+def column_plan(before, after):
+    """Record the dtype chosen for a column (and its categories)"""
+    entry = {'source': str(before.dtype), 'dtype': str(after.dtype)}
+    if isinstance(after.dtype, pd.CategoricalDtype):
+        entry['categories'] = after.cat.categories.tolist()
+    return entry
+
+
+def apply_column_plan(series, entry):
+    """Convert a column using a cached plan; None when the column breaks the plan"""
+    if str(series.dtype) != entry['source']:
+        return None
+    if entry['dtype'] == entry['source']:
+        return series
+
+    if entry['dtype'] == 'category':
+        result = pd.Series(
+            pd.Categorical(series, categories=entry['categories']),
+            index=series.index,
+            name=series.name
+        )
+        # Values outside the known categories come back as NaN
+        if (result.isna().to_numpy() != series.isna().to_numpy()).any():
+            return None
+        return result
+
+    if entry['dtype'] == 'float32':
+        values = series.to_numpy()
+        narrowed = values.astype(np.float32)
+        if not np.array_equal(narrowed.astype(np.float64), values, equal_nan=True):
+            return None
+        return pd.Series(narrowed, index=series.index, name=series.name)
+
+    target = pd.api.types.pandas_dtype(entry['dtype'])
+    if not pd.api.types.is_integer_dtype(target):
+        return None
+    nullable = not isinstance(target, np.dtype)
+    if series.hasnans and not nullable:
+        return None
+    if series.count():
+        info = np.iinfo(target.numpy_dtype if nullable else target)
+        lo, hi = series.min(), series.max()
+        if lo < info.min or hi > info.max:
+            return None
+        if series.dtype.kind == 'f' and not np.all(np.mod(series.dropna().to_numpy(), 1) == 0):
+            return None
+    return series.astype(target)
+
+
+def optimize_df(df, report=False, use_schema_cache=False, keep_floats=False):
+    """Optimize dataframe memory usage.
+
+    Each column is converted to its smallest lossless dtype and the result is
+    built in one step, reusing unchanged columns. With report=True a
+    (df, report) pair is returned, report holding the dtype and memory of
+    every column before and after.
+
+    With use_schema_cache=True the dtypes chosen for this column layout are
+    remembered, and later frames with the same columns are converted straight
+    to them. Only columns that no longer fit their plan (new categories,
+    values out of range, a different source dtype) are inferred again.
+
+    With keep_floats=True float columns are left as read, so every value
+    still prints as it did (the comparison engine compares str() forms, and
+    3 written from an integer column is not 3.0).
+    """
+    plan = {}
+    new_plan = {}
+    if use_schema_cache:
+        fingerprint = schema_fingerprint(df.columns, keep_floats)
+        plan = load_schema_plan(fingerprint) or {}
+
+    columns = []
+    for idx in range(df.shape[1]):
+        series = df.iloc[:, idx]
+        name = str(df.columns[idx])
+        converted = apply_column_plan(series, plan[name]) if name in plan else None
+        if converted is not None:
+            new_plan[name] = plan[name]
+        else:
+            converted = optimized_column(series, keep_floats)
+            if use_schema_cache:
+                new_plan[name] = column_plan(series, converted)
+        columns.append(converted)
+
+    if use_schema_cache and new_plan != plan:
+        save_schema_plan(fingerprint, new_plan)
+
+    result = pd.DataFrame(dict(enumerate(columns)), index=df.index, copy=False)
+    result.columns = df.columns
+
+    if not report:
+        return result
+
+    memory_report = pd.DataFrame({
+        'column': df.columns,
+        'dtype_before': [str(dtype) for dtype in df.dtypes],
+        'dtype_after': [str(dtype) for dtype in result.dtypes],
+        'bytes_before': df.memory_usage(index=False, deep=True).to_numpy(),
+        'bytes_after': result.memory_usage(index=False, deep=True).to_numpy()
+    })
+    memory_report['saved_pct'] = (
+        (1 - memory_report['bytes_after'] / memory_report['bytes_before'].where(memory_report['bytes_before'] > 0))
+        * 100
+    ).fillna(0).round(1)
+    return result, memory_report
@@ -0,0 +1,338 @@
+import hashlib
+import math
+import os
+import tempfile
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+try:
+    from openpyxl.worksheet._reader import WorkSheetParser
+except ImportError:
+    # Other openpyxl layouts: cumulative exports are then always loaded in full
+    WorkSheetParser = None
+
+
+# Where parsed workbooks are kept and how much disk they may use
+CACHE_DIR = os.environ.get('PDM_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'pdm_cache'))
+CACHE_MAX_BYTES = int(os.environ.get('PDM_CACHE_MAX_MB', '2048')) * 1024 * 1024
+
+# Saved frames are Parquet, or pickle when Parquet cannot hold a column
+FRAME_SUFFIXES = ('.parquet', '.pkl')
+
+# Columns identifying a submission in KoBo/ODK exports, most specific first
+UUID_COLUMNS = ('_uuid', 'meta/instanceID', '_submission__uuid')
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's content, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def evict_cache(cache_dir, max_bytes):
+    """Remove least recently used cache files until the cache fits in max_bytes"""
+    entries = []
+    for name in os.listdir(cache_dir):
+        # Files still being written are left alone
+        if not name.endswith(FRAME_SUFFIXES) or '.tmp' in name:
+            continue
+        path = os.path.join(cache_dir, name)
+        stat = os.stat(path)
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def iter_data_rows(rows):
+    """Data rows of a sheet; like pd.read_excel, trailing blank rows are dropped
+    but blank rows in between are kept (as all-None rows)"""
+    pending_empty = 0
+    for row in rows:
+        if all(value is None for value in row):
+            pending_empty += 1
+            continue
+        for _ in range(pending_empty):
+            yield (None,) * len(row)
+        pending_empty = 0
+        yield row
+
+
+def read_excel_columns(path, columns, chunk_size=5000):
+    """Stream a workbook in read-only mode, building only the requested columns.
+
+    Rows are read one at a time and collected into DataFrame chunks of
+    `chunk_size` rows, so memory grows with the projected columns rather
+    than the full sheet. Requested columns missing from the sheet are skipped.
+    """
+    wanted = set(columns)
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        # pd.read_excel reads the first sheet, not the one active when saved
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None) or ()
+
+        positions = []
+        names = []
+        for idx, name in enumerate(header):
+            if name in wanted and name not in names:
+                positions.append(idx)
+                names.append(name)
+
+        chunks = []
+        buffer = []
+        for row in iter_data_rows(rows):
+            values = (row[idx] if idx < len(row) else None for idx in positions)
+            buffer.append(tuple(math.nan if value is None else value for value in values))
+            if len(buffer) >= chunk_size:
+                chunks.append(pd.DataFrame.from_records(buffer, columns=names))
+                buffer = []
+        if buffer or not chunks:
+            chunks.append(pd.DataFrame.from_records(buffer, columns=names))
+    finally:
+        workbook.close()
+
+    return pd.concat(chunks, ignore_index=True).infer_objects()
+
+
+def read_parquet_frame(path):
+    """A frame saved as Parquet, with missing text as NaN like a fresh Excel parse"""
+    df = pd.read_parquet(path)
+    for name in df.columns[df.dtypes == object]:
+        df[name] = df[name].where(df[name].notna(), np.nan)
+    return df
+
+
+def write_frame(df, stem, index=False):
+    """Save a frame as stem.parquet, or as stem.pkl when Parquet cannot hold it.
+
+    Parquet needs one type per column, so a column mixing numbers and text
+    (common in KoBo exports) is only kept exactly by pickle. Returns the path
+    written.
+    """
+    path = f"{stem}.parquet"
+    try:
+        df.to_parquet(path, index=index)
+        return path
+    except (TypeError, ValueError):
+        # pyarrow's ArrowTypeError / ArrowInvalid: values of mixed types
+        if os.path.exists(path):
+            os.remove(path)
+    path = f"{stem}.pkl"
+    df.to_pickle(path)
+    return path
+
+
+def read_frame(path):
+    """A frame saved by write_frame"""
+    if path.endswith('.pkl'):
+        return pd.read_pickle(path)
+    return read_parquet_frame(path)
+
+
+def read_excel_cached(path, columns=None, cache_dir=None, max_bytes=None):
+    """Read an Excel upload, reusing a saved copy of identical earlier uploads.
+
+    Copies are Parquet, or pickle for frames Parquet cannot hold (see
+    write_frame). When `columns` is given the workbook is streamed and only
+    those columns are built (see read_excel_columns); the projection is part
+    of the cache key.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    os.makedirs(cache_dir, exist_ok=True)
+
+    cache_key = file_hash(path)
+    if columns is not None:
+        projection = hashlib.sha256('\x1f'.join(columns).encode('utf-8')).hexdigest()[:16]
+        cache_key = f"{cache_key}-{projection}"
+    stem = os.path.join(cache_dir, cache_key)
+    for suffix in FRAME_SUFFIXES:
+        cached_path = stem + suffix
+        if not os.path.exists(cached_path):
+            continue
+        try:
+            df = read_frame(cached_path)
+            # Touch the file so eviction treats it as recently used
+            os.utime(cached_path)
+            return df
+        except Exception as e:
+            print(f"Error reading cached copy, parsing workbook again: {str(e)}")
+
+    if columns is None:
+        df = pd.read_excel(path, engine='openpyxl')
+    else:
+        df = read_excel_columns(path, columns)
+
+    tmp_stem = f"{stem}.{os.getpid()}.tmp"
+    try:
+        written = write_frame(df, tmp_stem)
+        os.replace(written, stem + os.path.splitext(written)[1])
+        evict_cache(cache_dir, max_bytes)
+    except Exception as e:
+        # The upload still works uncached
+        print(f"Error caching workbook: {str(e)}")
+        for suffix in FRAME_SUFFIXES:
+            if os.path.exists(tmp_stem + suffix):
+                os.remove(tmp_stem + suffix)
+
+    return df
+
+
+def cell_text(value):
+    """Canonical text of a cell, the same whether it came from openpyxl or pandas"""
+    if value is None or value is pd.NA or value is pd.NaT or (isinstance(value, float) and math.isnan(value)):
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def row_key(values, uuid_position=None):
+    """Identity of a submission: its UUID when the sheet has one, else a hash of the row"""
+    if uuid_position is not None:
+        return cell_text(values[uuid_position])
+    text = '\x1f'.join(cell_text(value) for value in values)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def uuid_position(header):
+    """Position of the submission UUID column in a header, if there is one"""
+    for name in UUID_COLUMNS:
+        if name in header:
+            return list(header).index(name)
+    return None
+
+
+def sheet_signature(df, anchor_count=3):
+    """What an appended export must still contain for `df` to be its prefix.
+
+    Records the header, the number of rows and the keys (see row_key) of a
+    few anchor rows spread over the frame. Returns None when the header
+    cannot be matched against a raw sheet (generated or repeated names).
+    """
+    header = tuple(df.columns)
+    if len(set(header)) != len(header) or any(
+            not isinstance(name, str) or name.startswith('Unnamed:') for name in header):
+        return None
+    n = len(df)
+    positions = sorted({int(pos) for pos in np.linspace(0, n - 1, anchor_count)}) if n else []
+    uuid_at = uuid_position(header)
+    values = df.iloc[positions].astype(object).to_numpy()
+    return {
+        'header': header,
+        'rows': n,
+        'anchors': {pos: row_key(row, uuid_at) for pos, row in zip(positions, values)}
+    }
+
+
+class PrefixSkippingParser(WorkSheetParser if WorkSheetParser is not None else object):
+    """Worksheet parser that leaves the cells of already known rows unconverted.
+
+    Rows numbered below `skip_before` (other than those in `keep`) are
+    returned with None instead of their cells, which skips openpyxl's
+    per-cell conversion, the bulk of the cost of reading a sheet.
+    """
+
+    def __init__(self, *args, skip_before=0, keep=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.skip_before = skip_before
+        self.keep = set(keep)
+
+    def parse_row(self, row):
+        number = row.get('r')
+        number = int(number) if number is not None and number.isdigit() else self.row_counter + 1
+        if 1 < number < self.skip_before and number not in self.keep:
+            self.row_counter = number
+            self.col_counter = 0
+            return number, None
+        return super().parse_row(row)
+
+
+def read_excel_appended(path, signature, chunk_size=5000):
+    """Rows a cumulative export added after the rows described by `signature`.
+
+    The sheet is parsed without converting the cells of the known prefix,
+    except at the anchor rows, which must still match. Returns None when the
+    header differs, the file is shorter or an anchor row changed, in which
+    case the file has to be loaded in full.
+    """
+    if WorkSheetParser is None:
+        return None
+    known_rows = signature['rows']
+    anchors = signature['anchors']
+    header = signature['header']
+    width = len(header)
+    uuid_at = uuid_position(header)
+    # The header is sheet row 1, so data position p is sheet row p + 2
+    anchor_rows = {pos + 2: key for pos, key in anchors.items()}
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        with sheet._get_source() as source:
+            parser = PrefixSkippingParser(
+                source,
+                sheet._shared_strings,
+                data_only=True,
+                epoch=workbook.epoch,
+                date_formats=workbook._date_formats,
+                timedelta_formats=workbook._timedelta_formats,
+                skip_before=known_rows + 2,
+                keep=anchor_rows
+            )
+            rows = {}
+            last_row = 0
+            for number, cells in parser.parse():
+                if cells is None:
+                    last_row = number
+                    continue
+                values = [None] * width
+                for cell in cells:
+                    if cell['column'] <= width:
+                        values[cell['column'] - 1] = cell['value']
+                if all(value is None for value in values) and number != 1:
+                    continue
+                last_row = number
+                if number == 1:
+                    if tuple(values) != header:
+                        return None
+                elif number in anchor_rows:
+                    if row_key(values, uuid_at) != anchor_rows.pop(number):
+                        return None
+                else:
+                    rows[number] = tuple(math.nan if value is None else value for value in values)
+    finally:
+        workbook.close()
+
+    # Anchor rows never seen were blank
+    blank = (None,) * width
+    if any(row_key(blank, uuid_at) != key for key in anchor_rows.values()):
+        return None
+    if last_row - 1 < known_rows:
+        return None
+
+    # Blank rows between new rows are kept, as pd.read_excel does
+    blank_row = (math.nan,) * width
+    records = [rows.get(number, blank_row) for number in range(known_rows + 2, last_row + 1)]
+    chunks = [
+        pd.DataFrame.from_records(records[start:start + chunk_size], columns=list(header))
+        for start in range(0, len(records), chunk_size)
+    ] or [pd.DataFrame(columns=list(header))]
+    tail = pd.concat(chunks, ignore_index=True).infer_objects()
+    tail.index = pd.RangeIndex(known_rows, known_rows + len(tail))
+    return tail
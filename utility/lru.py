@@ -0,0 +1,36 @@
+import threading
+from collections import OrderedDict
+
+
+class SizedLRU:
+    """Thread-safe LRU cache bounded by the total size of its values in bytes.
+
+    `size` gives the size of a value (len for bytes). The least recently used
+    values are evicted once over max_bytes, but the newest one is always kept.
+    """
+
+    def __init__(self, max_bytes, size=len):
+        self.max_bytes = max_bytes
+        self.size = size
+        self.values = OrderedDict()
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.values.get(key)
+            if value is not None:
+                self.values.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            old = self.values.pop(key, None)
+            if old is not None:
+                self.total -= self.size(old)
+            self.values[key] = value
+            self.total += self.size(value)
+            while self.total > self.max_bytes and len(self.values) > 1:
+                _, evicted = self.values.popitem(last=False)
+                self.total -= self.size(evicted)
+        return value
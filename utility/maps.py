@@ -0,0 +1,363 @@
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from branca.element import Template
+from folium.map import Layer
+from starlette.responses import JSONResponse, Response
+
+from utility.lru import SizedLRU
+
+
+# Memory budget for rendered map pages shared by all sessions
+MAP_CACHE_MAX_BYTES = int(os.environ.get('PDM_MAP_CACHE_MAX_MB', '256')) * 1024 * 1024
+
+# Level of detail: above RAW_POINT_LIMIT households a map switches to clusters
+# computed on the server, and never draws more than MAX_VIEW_MARKERS at once
+RAW_POINT_LIMIT = int(os.environ.get('PDM_MAP_RAW_POINT_LIMIT', '5000'))
+MAX_VIEW_MARKERS = int(os.environ.get('PDM_MAP_MAX_VIEW_MARKERS', '1000'))
+RAW_ZOOM = 16
+CLUSTER_CELL_PX = 80
+POINT_INDEX_LIMIT = 16
+
+POPUP_COLUMNS = {
+    'village': 'Village',
+    'ward': 'Ward',
+    'household': 'HouseholdID',
+    'head': 'Name of Head of Household',
+    'status': 'Revisit-Status'
+}
+
+# Builds each cluster marker in the browser from a [lat, lon, color] row
+CLUSTER_CALLBACK = """
+    function (row) {
+        return L.circleMarker(new L.LatLng(row[0], row[1]), {
+            radius: 8, color: row[2], fill: true
+        });
+    };
+"""
+
+
+def text_column(df, col):
+    """Column as plain strings with missing values (or a missing column) as ''"""
+    if col not in df.columns:
+        return np.full(len(df), '', dtype=object)
+    values = df[col].astype(object)
+    return values.where(values.notna(), '').astype(str).to_numpy(dtype=object)
+
+
+def located(df):
+    """Rows with usable GPS coordinates"""
+    return df[df['GPS Latitude'].notna() & df['GPS Longitude'].notna()]
+
+
+def point_colors(df):
+    """'red' for households that need a revisit, 'blue' otherwise"""
+    needs_revisit = df['Revisit-Status'].astype(str).str.lower().to_numpy() == 'yes'
+    return np.where(needs_revisit, 'red', 'blue').astype(object)
+
+
+def household_features(df):
+    """GeoJSON FeatureCollection of households, with popup fields and color as properties"""
+    df = located(df)
+    lats = df['GPS Latitude'].astype(float).to_numpy().tolist()
+    lons = df['GPS Longitude'].astype(float).to_numpy().tolist()
+    properties = {key: text_column(df, col).tolist() for key, col in POPUP_COLUMNS.items()}
+    properties['color'] = point_colors(df).tolist()
+
+    keys = list(properties)
+    columns = [properties[key] for key in keys]
+    features = [
+        {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+            'properties': dict(zip(keys, values))
+        }
+        for lat, lon, values in zip(lats, lons, zip(*columns))
+    ]
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def cluster_points(df):
+    """[lat, lon, color] rows for FastMarkerCluster"""
+    df = located(df)
+    return list(zip(
+        df['GPS Latitude'].astype(float).to_numpy().tolist(),
+        df['GPS Longitude'].astype(float).to_numpy().tolist(),
+        point_colors(df).tolist()
+    ))
+
+
+# Builds a household popup in the browser from its properties
+POPUP_JS = """
+        function household_popup(p, lat, lon) {
+            var e = function (value) {
+                return String(value).replace(/[&<>"']/g, function (c) {
+                    return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+                });
+            };
+            return "<div style='min-width: 200px'>" +
+                "<b>Village:</b> " + e(p.village) + "<br>" +
+                "<b>Ward:</b> " + e(p.ward) + "<br>" +
+                "<b>Household ID:</b> " + e(p.household) + "<br>" +
+                "<b>Head of Household:</b> " + e(p.head) + "<br>" +
+                "<b>Revisit Status:</b> " + e(p.status) + "<br><br>" +
+                "<a href='https://www.google.com/maps/dir/?api=1&destination=" + lat + "," + lon + "' " +
+                "target='_blank' style='background-color: #4CAF50; color: white; padding: 8px 15px; " +
+                "text-decoration: none; border-radius: 4px; display: inline-block;'>" +
+                "Navigate to Household</a></div>";
+        }
+"""
+
+
+class HouseholdLayer(Layer):
+    """Household points drawn from one GeoJSON object.
+
+    Marker color and the popup are built in the browser from each feature's
+    properties, so the page carries the data once instead of a marker and a
+    popup HTML block per household.
+    """
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        {{ this.popup_js }}
+        var {{ this.get_name() }} = L.geoJSON({{ this.data|tojson }}, {
+            pointToLayer: function (feature, latlng) {
+                var color = feature.properties.color;
+                return L.circleMarker(latlng, {
+                    radius: 8, color: color, fill: true, fillColor: color,
+                    fillOpacity: 0.7, weight: 2, opacity: 0.8
+                });
+            },
+            onEachFeature: function (feature, layer) {
+                var p = feature.properties;
+                var c = feature.geometry.coordinates;
+                layer.bindPopup(household_popup(p, c[1], c[0]), {maxWidth: 300});
+            }
+        });
+        {% endmacro %}
+    """)
+
+    def __init__(self, data, name=None, overlay=True, control=True, show=True):
+        super().__init__(name=name, overlay=overlay, control=control, show=show)
+        self._name = 'HouseholdLayer'
+        self.data = data
+        self.popup_js = POPUP_JS
+
+
+def data_fingerprint(df):
+    """Short content hash of a DataFrame, used to key cached outputs"""
+    hashes = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    digest = hashlib.sha256(hashes.tobytes())
+    digest.update('\x1f'.join(map(str, df.columns)).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def map_cache_key(data_hash, *parts):
+    """Cache key of a map page for one dataset and selection (e.g. LGA, ward)"""
+    raw = '\x1f'.join([data_hash] + [str(part) for part in parts])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:24]
+
+
+class MapPage:
+    """A rendered map page with its gzip body and ETag"""
+
+    def __init__(self, html):
+        self.body = html.encode('utf-8')
+        self.gzip_body = gzip.compress(self.body, compresslevel=6)
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+        self.size = len(self.body) + len(self.gzip_body)
+
+
+class MapCache(SizedLRU):
+    """LRU of rendered map pages, bounded by their total bytes (body and gzip)"""
+
+    def __init__(self, max_bytes):
+        super().__init__(max_bytes, size=lambda page: page.size)
+
+    def put(self, key, html):
+        return super().put(key, MapPage(html))
+
+
+map_cache = MapCache(MAP_CACHE_MAX_BYTES)
+
+
+def map_page_response(request):
+    """Serve a cached map page (?key=...) with ETag revalidation and gzip"""
+    page = map_cache.get(request.query_params.get('key', ''))
+    if page is None:
+        return Response("Map expired, please reselect the LGA.", status_code=404, media_type='text/plain')
+
+    headers = {
+        'ETag': page.etag,
+        'Cache-Control': 'private, max-age=3600',
+        'Vary': 'Accept-Encoding'
+    }
+    if page.etag in request.headers.get('if-none-match', ''):
+        return Response(status_code=304, headers=headers)
+    if 'gzip' in request.headers.get('accept-encoding', ''):
+        headers['Content-Encoding'] = 'gzip'
+        return Response(page.gzip_body, media_type='text/html', headers=headers)
+    return Response(page.body, media_type='text/html', headers=headers)
+
+
+def mercator_xy(lats, lons):
+    """Web Mercator position of each point in [0, 1) world coordinates"""
+    lats = np.clip(lats, -85.0511, 85.0511)
+    x = (lons + 180.0) / 360.0
+    sin_lat = np.sin(np.radians(lats))
+    y = 0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * np.pi)
+    return np.clip(x, 0, 1 - 1e-12), np.clip(y, 0, 1 - 1e-12)
+
+
+class PointIndex:
+    """Grid index of household points with cluster counts per zoom level.
+
+    For every zoom below RAW_ZOOM points are binned into screen cells of
+    CLUSTER_CELL_PX pixels, and each cell keeps its household count, revisit
+    count and mean position. A view query then answers with at most
+    MAX_VIEW_MARKERS clusters or raw households, whatever the dataset size.
+    """
+
+    def __init__(self, df):
+        df = located(df)
+        self.lats = df['GPS Latitude'].astype(float).to_numpy()
+        self.lons = df['GPS Longitude'].astype(float).to_numpy()
+        self.colors = point_colors(df)
+        self.text = {key: text_column(df, col) for key, col in POPUP_COLUMNS.items()}
+        needs_revisit = (self.colors == 'red').astype(np.int64)
+
+        x, y = mercator_xy(self.lats, self.lons)
+        self.levels = []
+        for zoom in range(RAW_ZOOM):
+            cells = max(1, int(256 * 2**zoom / CLUSTER_CELL_PX))
+            cell_ids = np.floor(x * cells).astype(np.int64) * cells + np.floor(y * cells).astype(np.int64)
+            _, inverse = np.unique(cell_ids, return_inverse=True)
+            counts = np.bincount(inverse)
+            self.levels.append((
+                np.bincount(inverse, weights=self.lats) / counts,
+                np.bincount(inverse, weights=self.lons) / counts,
+                counts,
+                np.bincount(inverse, weights=needs_revisit).astype(np.int64)
+            ))
+
+    def __len__(self):
+        return len(self.lats)
+
+    def query(self, zoom, south, west, north, east):
+        """Clusters or households inside a bounding box at a zoom level"""
+        in_view = (self.lats >= south) & (self.lats <= north) & (self.lons >= west) & (self.lons <= east)
+        visible = np.flatnonzero(in_view)
+
+        if zoom >= RAW_ZOOM or len(visible) <= MAX_VIEW_MARKERS:
+            visible = visible[:MAX_VIEW_MARKERS]
+            points = [
+                [self.lats[i], self.lons[i], self.colors[i]] + [self.text[key][i] for key in POPUP_COLUMNS]
+                for i in visible.tolist()
+            ]
+            return {'clusters': [], 'points': points, 'total': int(in_view.sum())}
+
+        lats, lons, counts, revisits = self.levels[max(0, min(int(zoom), RAW_ZOOM - 1))]
+        cells = np.flatnonzero((lats >= south) & (lats <= north) & (lons >= west) & (lons <= east))
+        if len(cells) > MAX_VIEW_MARKERS:
+            cells = cells[np.argpartition(counts[cells], -MAX_VIEW_MARKERS)[-MAX_VIEW_MARKERS:]]
+        clusters = np.column_stack([lats[cells], lons[cells], counts[cells], revisits[cells]]).tolist()
+        return {'clusters': clusters, 'points': [], 'total': int(in_view.sum())}
+
+
+# Point indexes of recently mapped selections, keyed like map_cache
+point_indexes = OrderedDict()
+point_indexes_lock = threading.Lock()
+
+
+def get_point_index(key, df=None):
+    """Point index for a map key, built from df when missing"""
+    with point_indexes_lock:
+        index = point_indexes.get(key)
+        if index is not None:
+            point_indexes.move_to_end(key)
+            return index
+    if df is None:
+        return None
+    index = PointIndex(df)
+    with point_indexes_lock:
+        point_indexes[key] = index
+        while len(point_indexes) > POINT_INDEX_LIMIT:
+            point_indexes.popitem(last=False)
+    return index
+
+
+def point_query_response(request):
+    """JSON clusters/households for ?key=&zoom=&bbox=south,west,north,east"""
+    params = request.query_params
+    index = get_point_index(params.get('key', ''))
+    if index is None:
+        return JSONResponse({'error': 'Map expired, please reselect the LGA.'}, status_code=404)
+    try:
+        zoom = int(float(params.get('zoom', '0')))
+        south, west, north, east = (float(value) for value in params.get('bbox', '').split(','))
+    except ValueError:
+        return JSONResponse({'error': 'Invalid zoom or bbox'}, status_code=400)
+    return JSONResponse(index.query(zoom, south, west, north, east))
+
+
+class ClusteredHouseholdLayer(Layer):
+    """Household layer fed by point_query_response as the map moves.
+
+    At low zoom it shows server-side clusters (click to zoom in), and raw
+    households with popups once a view holds few enough of them.
+    """
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        {{ this.popup_js }}
+        var {{ this.get_name() }} = L.layerGroup();
+        (function () {
+            var layer = {{ this.get_name() }};
+            var map = {{ this._parent.get_name() }};
+            var request = 0;
+            function refresh() {
+                var b = map.getBounds();
+                var current = ++request;
+                var url = {{ this.url|tojson }} + "&zoom=" + map.getZoom() + "&bbox=" +
+                    [b.getSouth(), b.getWest(), b.getNorth(), b.getEast()].join(",");
+                fetch(url).then(function (r) { return r.json(); }).then(function (data) {
+                    if (current !== request || !data.clusters) { return; }
+                    layer.clearLayers();
+                    data.clusters.forEach(function (c) {
+                        var size = 24 + Math.min(24, Math.round(Math.log2(c[2]) * 3));
+                        var color = c[3] > 0 ? "#d32f2f" : "#1976d2";
+                        L.marker([c[0], c[1]], {
+                            icon: L.divIcon({
+                                html: "<div style='background:" + color + ";color:white;border-radius:50%;" +
+                                    "width:" + size + "px;height:" + size + "px;line-height:" + size + "px;" +
+                                    "text-align:center;font-size:12px;opacity:0.85'>" + c[2] + "</div>",
+                                className: "", iconSize: [size, size]
+                            })
+                        }).bindTooltip(c[2] + " households, " + c[3] + " need revisit")
+                          .on("click", function () { map.setView([c[0], c[1]], map.getZoom() + 2); })
+                          .addTo(layer);
+                    });
+                    data.points.forEach(function (p) {
+                        L.circleMarker([p[0], p[1]], {
+                            radius: 8, color: p[2], fill: true, fillColor: p[2],
+                            fillOpacity: 0.7, weight: 2, opacity: 0.8
+                        }).bindPopup(household_popup({
+                            village: p[3], ward: p[4], household: p[5], head: p[6], status: p[7]
+                        }, p[0], p[1]), {maxWidth: 300}).addTo(layer);
+                    });
+                });
+            }
+            map.on("moveend", refresh);
+            map.whenReady(refresh);
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, url, name=None, overlay=True, control=True, show=True):
+        super().__init__(name=name, overlay=overlay, control=control, show=show)
+        self._name = 'ClusteredHouseholdLayer'
+        self.url = url
+        self.popup_js = POPUP_JS
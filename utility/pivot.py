@@ -0,0 +1,118 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from utility.comparison import HOUSEHOLD_KEY
+
+
+# Aggregates of the values column, plus distinct households per cell
+AGGREGATES = ('count', 'sum', 'mean', 'min', 'max', 'households')
+TOTAL_LABEL = 'Total'
+
+
+def observed_codes(series):
+    """Integer codes of a key column (-1 for missing) and the labels present.
+
+    Categorical columns reuse their codes; only categories that actually
+    occur get a code, so unused categories never create empty rows.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy().astype(np.int64)
+        present = np.flatnonzero(np.bincount(codes[codes >= 0], minlength=len(series.cat.categories)))
+        remap = np.full(len(series.cat.categories) + 1, -1, dtype=np.int64)
+        remap[present] = np.arange(len(present))
+        return remap[codes], series.cat.categories[present]
+    codes, labels = pd.factorize(series, sort=True)
+    return codes.astype(np.int64), labels
+
+
+def distinct_counts(groups, households, n_groups):
+    """Distinct households per group code"""
+    if len(groups) == 0:
+        return np.zeros(n_groups, dtype=np.int64)
+    n_households = int(households.max()) + 1
+    pairs = np.unique(groups * n_households + households)
+    return np.bincount(pairs // n_households, minlength=n_groups)
+
+
+def pivot_cells(df, index, columns, values, positions=None, key=HOUSEHOLD_KEY):
+    """Cross-tabulate `values` by `index` rows and `columns` columns in one pass.
+
+    The key columns are factorised once into a single cell code and every
+    aggregate in AGGREGATES is computed from one grouped pass over it, with
+    margins derived from the same codes instead of extra passes. Rows whose
+    index or column value is missing are left out, as in pd.pivot_table.
+    Returns (row labels, column labels, {aggregate: 2-D array}); each array
+    has one extra row and column holding the margins.
+    """
+    if positions is not None:
+        df = df.take(positions)
+    row_codes, row_labels = observed_codes(df[index])
+    col_codes, col_labels = observed_codes(df[columns])
+    n_rows, n_cols = len(row_labels), len(col_labels)
+
+    valid = (row_codes >= 0) & (col_codes >= 0)
+    rows = row_codes[valid]
+    cols = col_codes[valid]
+    cells = rows * n_cols + cols
+    n_cells = n_rows * n_cols
+
+    shape = (n_rows + 1, n_cols + 1)
+    result = {}
+
+    # count, sum, min and max of every cell from one grouped pass
+    series = df[values][valid].reset_index(drop=True)
+    numeric = pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype)
+    funcs = ['count', 'sum', 'min', 'max'] if numeric else ['count']
+    grouped = series.groupby(cells, sort=False).agg(funcs)
+    cell_ids = grouped.index.to_numpy()
+
+    for func in funcs:
+        table = np.full(shape, np.nan)
+        flat = np.full(n_cells, np.nan)
+        flat[cell_ids] = grouped[func].to_numpy(dtype='float64', na_value=np.nan)
+        if func == 'count':
+            flat = np.nan_to_num(flat)
+        grid = flat.reshape(n_rows, n_cols)
+        table[:n_rows, :n_cols] = grid
+        combine = {'count': np.nansum, 'sum': np.nansum, 'min': np.nanmin, 'max': np.nanmax}[func]
+        with warnings.catch_warnings():
+            # All-missing rows or columns have no min/max
+            warnings.simplefilter('ignore', RuntimeWarning)
+            table[:n_rows, n_cols] = combine(grid, axis=1) if n_cols else np.nan
+            table[n_rows, :n_cols] = combine(grid, axis=0) if n_rows else np.nan
+            table[n_rows, n_cols] = combine(grid) if n_cells else np.nan
+        if func == 'sum':
+            # A sum over no values is missing, not zero
+            table[result['count'] == 0] = np.nan
+        result[func] = table
+
+    if numeric:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result['mean'] = result['sum'] / result['count']
+
+    # Distinct households per cell and per margin, from the same codes
+    households = np.zeros(shape)
+    if key in df.columns:
+        hh_codes, _ = pd.factorize(df[key])
+        hh_codes = hh_codes[valid]
+        has_id = hh_codes >= 0
+        hh, hh_rows, hh_cols, hh_cells = hh_codes[has_id], rows[has_id], cols[has_id], cells[has_id]
+        households[:n_rows, :n_cols] = distinct_counts(hh_cells, hh, n_cells).reshape(n_rows, n_cols)
+        households[:n_rows, n_cols] = distinct_counts(hh_rows, hh, n_rows)
+        households[n_rows, :n_cols] = distinct_counts(hh_cols, hh, n_cols)
+        households[n_rows, n_cols] = len(np.unique(hh))
+    result['households'] = households
+
+    return row_labels, col_labels, result
+
+
+def pivot_frame(row_labels, col_labels, table, index):
+    """A pivot_cells array as a DataFrame with 'Total' margins"""
+    frame = pd.DataFrame(
+        table,
+        columns=[str(label) for label in col_labels] + [TOTAL_LABEL]
+    )
+    frame.insert(0, index, [str(label) for label in row_labels] + [TOTAL_LABEL])
+    return frame
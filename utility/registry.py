@@ -0,0 +1,103 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+# Memory kept for datasets no session holds any more
+REGISTRY_MAX_BYTES = int(os.environ.get('PDM_REGISTRY_MAX_MB', '1024')) * 1024 * 1024
+
+
+def dataset_bytes(value):
+    """Approximate memory held by a frame, array or a dict/list of them"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Index):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sum(dataset_bytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(dataset_bytes(v) for v in value)
+    return 0
+
+
+def freeze(value):
+    """Make the arrays of a shared dataset read-only so no session can change them"""
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, dict):
+        for v in value.values():
+            freeze(v)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            freeze(v)
+    return value
+
+
+class DatasetRegistry:
+    """One copy of every processed dataset, shared by all sessions of a worker.
+
+    Datasets are keyed by what they were built from (e.g. the content hash of
+    an upload and how it was processed). Each holder, a (session id, slot)
+    pair such as (id, 'cleaning'), refers to at most one dataset. Datasets
+    still held are never dropped; released ones are kept for later uploads of
+    the same file until they no longer fit in max_bytes, least recently used
+    first. Shared datasets must be treated as read-only.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = REGISTRY_MAX_BYTES if max_bytes is None else max_bytes
+        self.entries = OrderedDict()
+        self.holders = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, key, holder, build):
+        """Dataset for key, built with build() unless another session already did"""
+        self.release(holder)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                entry['holders'].add(holder)
+                self.holders[holder] = key
+                return entry['value']
+
+        value = freeze(build())
+        with self.lock:
+            # Another thread may have built the same dataset meanwhile
+            entry = self.entries.setdefault(key, {'value': value, 'bytes': dataset_bytes(value), 'holders': set()})
+            entry['holders'].add(holder)
+            self.holders[holder] = key
+            self.evict()
+            return entry['value']
+
+    def release(self, holder):
+        """Drop a holder's reference (the dataset stays cached while it fits)"""
+        with self.lock:
+            key = self.holders.pop(holder, None)
+            if key in self.entries:
+                self.entries[key]['holders'].discard(holder)
+            self.evict()
+
+    def release_session(self, session_id):
+        for holder in [holder for holder in self.holders if holder[0] == session_id]:
+            self.release(holder)
+
+    def evict(self):
+        """Remove released datasets, oldest first, until the registry fits (lock held)"""
+        total = sum(entry['bytes'] for entry in self.entries.values())
+        for key in list(self.entries):
+            if total <= self.max_bytes:
+                break
+            entry = self.entries[key]
+            if not entry['holders']:
+                del self.entries[key]
+                total -= entry['bytes']
+
+
+# Registry shared by every session of this process
+datasets = DatasetRegistry()
@@ -0,0 +1,160 @@
+import heapq
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+
+# Villages handed to a supervisor per day, taken from a single ward
+VILLAGES_PER_ASSIGNMENT = 4
+
+# With PDM_SCHEDULE_WORKERS above 1, LGAs are scheduled in a process pool once
+# the upload has at least PARALLEL_MIN_ROWS rows (see benchmarks/schedule_benchmark.py)
+PARALLEL_MIN_ROWS = int(os.environ.get('PDM_SCHEDULE_PARALLEL_MIN_ROWS', '50000'))
+SCHEDULE_WORKERS = int(os.environ.get('PDM_SCHEDULE_WORKERS', '1'))
+
+_pool = None
+_pool_workers = 0
+
+SCHEDULE_COLUMNS = [
+    'Survey_Date', 'LGA', 'Supervisor', 'Ward',
+    'Village_Assignments', 'Total_Households', 'Revisits'
+]
+
+
+def ward_positions(lga_group):
+    """Row positions of each ward (in groupby order), keeping upload order within a ward"""
+    # Rows without a ward belong to no group (NaN), as in groupby('Ward')
+    codes = lga_group.groupby('Ward', sort=True).ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    order = np.argsort(codes, kind='stable')
+    order = order[codes[order] >= 0]
+    counts = np.bincount(codes[order]) if len(order) else np.array([], dtype=np.int64)
+    return np.split(order, np.cumsum(counts)[:-1]) if len(counts) else []
+
+
+def allocate_lga(lga_group, supervisor_ids, total_days):
+    """Assign villages of one LGA to supervisors day by day.
+
+    Each day every supervisor takes the next four villages of the first ward
+    (in ward order) that still has at least four left. Wards are kept in a
+    heap keyed on their order, so finding that ward costs O(log wards).
+    Returns (day_index, supervisor, ward_rank, positions) tuples.
+    """
+    wards = ward_positions(lga_group)
+    remaining = [len(positions) for positions in wards]
+    taken = [0] * len(wards)
+    ready = [rank for rank, count in enumerate(remaining) if count >= VILLAGES_PER_ASSIGNMENT]
+    heapq.heapify(ready)
+
+    assignments = []
+    for day_idx in range(total_days):
+        # Once no ward has four villages left nothing else can be assigned
+        if not ready:
+            break
+        for sup_id in supervisor_ids:
+            if not ready:
+                break
+            rank = heapq.heappop(ready)
+            start = taken[rank]
+            taken[rank] += VILLAGES_PER_ASSIGNMENT
+            remaining[rank] -= VILLAGES_PER_ASSIGNMENT
+            assignments.append((day_idx, sup_id, rank, wards[rank][start:start + VILLAGES_PER_ASSIGNMENT]))
+            if remaining[rank] >= VILLAGES_PER_ASSIGNMENT:
+                heapq.heappush(ready, rank)
+    return assignments, wards
+
+
+def schedule_lga(lga_name, lga_group, supervisor_ids, n_enum_per_sup, households_per_village,
+                 total_days, start_date):
+    """Schedule rows for a single LGA"""
+    assignments, wards = allocate_lga(lga_group, supervisor_ids, total_days)
+    if not assignments:
+        return []
+
+    villages = lga_group['Village'].to_numpy()
+    ward_names = lga_group['Ward'].to_numpy()
+    needs_revisit = (lga_group['REVISIT STATUS'].astype(str).str.strip().str.upper() == 'YES').to_numpy()
+    last_day = assignments[-1][0]
+    survey_dates = [(start_date + timedelta(days=day)).strftime('%Y-%m-%d') for day in range(last_day + 1)]
+    revisit_dates = [(start_date + timedelta(days=day + 2)).strftime('%Y-%m-%d') for day in range(last_day + 1)]
+
+    rows = []
+    for day_idx, sup_id, rank, positions in assignments:
+        enumerators = [f"{sup_id}_{j+1}" for j in range(n_enum_per_sup)]
+        # A repeated village name keeps the enumerator of its last occurrence, as before
+        enum_assignments = {
+            villages[pos]: enumerators[enum_idx % n_enum_per_sup]
+            for enum_idx, pos in enumerate(positions)
+        }
+        revisits = sorted({
+            f"{villages[pos]} (Revisit: {revisit_dates[day_idx]})"
+            for pos in positions if needs_revisit[pos]
+        })
+        rows.append((
+            survey_dates[day_idx],
+            lga_name,
+            sup_id,
+            str(ward_names[wards[rank][0]]),
+            ', '.join(f"{villages[pos]} ({enum_assignments[villages[pos]]})" for pos in positions),
+            len(positions) * households_per_village,
+            ', '.join(revisits) if revisits else 'No revisits'
+        ))
+    return rows
+
+
+def get_pool(workers):
+    """Process pool shared by all sessions, created on first use.
+
+    Workers are spawned rather than forked, since the server already runs
+    threads (chart rendering, workspace writes) that a fork would copy mid-state.
+    """
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        _pool_workers = workers
+    return _pool
+
+
+def build_schedule(df, selected_lga, mapping, n_enum_per_sup, households_per_village,
+                   total_days, start_date, workers=None, parallel_min_rows=None):
+    """Daily team deployment schedule for the selected LGA (or every LGA).
+
+    LGAs are independent, so with several LGAs and at least
+    `parallel_min_rows` rows they are scheduled in a process pool of
+    `workers` processes. Results are combined in LGA order either way.
+    """
+    workers = SCHEDULE_WORKERS if workers is None else workers
+    parallel_min_rows = PARALLEL_MIN_ROWS if parallel_min_rows is None else parallel_min_rows
+
+    if selected_lga:
+        lga_data = {selected_lga: df[df['LGA'] == selected_lga]}
+    else:
+        lga_data = {lga: group for lga, group in df.groupby('LGA')}
+
+    jobs = [
+        (lga_name, lga_group[['Ward', 'Village', 'REVISIT STATUS']], mapping[lga_name])
+        for lga_name, lga_group in lga_data.items()
+        if mapping.get(lga_name)
+    ]
+    args = (n_enum_per_sup, households_per_village, total_days, start_date)
+
+    rows = []
+    if workers > 1 and len(jobs) > 1 and len(df) >= parallel_min_rows:
+        pool = get_pool(workers)
+        futures = [pool.submit(schedule_lga, *job, *args) for job in jobs]
+        for future in futures:
+            rows.extend(future.result())
+    else:
+        for job in jobs:
+            rows.extend(schedule_lga(*job, *args))
+
+    if not rows:
+        return pd.DataFrame()
+
+    schedule_df = pd.DataFrame.from_records(rows, columns=SCHEDULE_COLUMNS)
+    return schedule_df.sort_values(['Survey_Date', 'LGA', 'Supervisor'])
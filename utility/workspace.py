@@ -0,0 +1,193 @@
+import json
+import os
+import re
+import secrets
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utility.loader import CACHE_DIR, read_frame, write_frame
+
+
+# Where session workspaces are kept, and for how long / how much disk
+WORKSPACE_DIR = os.environ.get('PDM_WORKSPACE_DIR', os.path.join(CACHE_DIR, 'workspaces'))
+WORKSPACE_MAX_AGE = float(os.environ.get('PDM_WORKSPACE_MAX_AGE_DAYS', '7')) * 24 * 3600
+WORKSPACE_MAX_BYTES = int(os.environ.get('PDM_WORKSPACE_MAX_MB', '4096')) * 1024 * 1024
+
+TOKEN_PATTERN = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+# Entries are written in the background, one at a time
+_writer = ThreadPoolExecutor(max_workers=1)
+
+
+def new_token():
+    """Random, URL-safe workspace token"""
+    return secrets.token_urlsafe(18)
+
+
+def valid_token(token):
+    return isinstance(token, str) and TOKEN_PATTERN.match(token) is not None
+
+
+def workspace_path(token):
+    if not valid_token(token):
+        raise ValueError("Invalid workspace token")
+    return os.path.join(WORKSPACE_DIR, token)
+
+
+def encode(value, folder, arrays):
+    """JSON description of a value; frames go to files (see write_frame), arrays to `arrays`"""
+    if isinstance(value, pd.DataFrame):
+        path = write_frame(value, os.path.join(folder, f"frame{len(os.listdir(folder))}"), index=True)
+        return {'kind': 'frame', 'file': os.path.basename(path)}
+    if isinstance(value, pd.Index):
+        path = write_frame(pd.DataFrame({'value': value}), os.path.join(folder, f"index{len(os.listdir(folder))}"))
+        return {'kind': 'index', 'file': os.path.basename(path)}
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        key = f"array{len(arrays)}"
+        arrays[key] = value
+        return {'kind': 'array', 'key': key}
+    if isinstance(value, dict):
+        return {'kind': 'dict', 'items': [[encode(k, folder, arrays), encode(v, folder, arrays)]
+                                          for k, v in value.items()]}
+    if isinstance(value, (list, tuple)):
+        return {'kind': type(value).__name__, 'items': [encode(v, folder, arrays) for v in value]}
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return {'kind': 'value', 'value': value}
+    raise TypeError(f"Cannot store {type(value).__name__} in a workspace")
+
+
+def decode(node, folder, arrays):
+    kind = node['kind']
+    if kind == 'frame':
+        return read_frame(os.path.join(folder, node['file']))
+    if kind == 'index':
+        return pd.Index(read_frame(os.path.join(folder, node['file']))['value'])
+    if kind == 'array':
+        return arrays[node['key']]
+    if kind == 'dict':
+        return {decode(k, folder, arrays): decode(v, folder, arrays) for k, v in node['items']}
+    if kind == 'list':
+        return [decode(v, folder, arrays) for v in node['items']]
+    if kind == 'tuple':
+        return tuple(decode(v, folder, arrays) for v in node['items'])
+    return node['value']
+
+
+def save_entry(token, name, value):
+    """Store one named value (a frame or a state dict) in a workspace.
+
+    The entry is written to a temporary folder and swapped in, so a crash
+    never leaves a half-written entry behind.
+    """
+    root = workspace_path(token)
+    target = os.path.join(root, name)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(root, exist_ok=True)
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        arrays = {}
+        manifest = encode(value, tmp, arrays)
+        np.savez(os.path.join(tmp, 'arrays.npz'), **arrays)
+        with open(os.path.join(tmp, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+
+        old = f"{target}.{os.getpid()}.old"
+        if os.path.exists(target):
+            os.replace(target, old)
+        os.replace(tmp, target)
+        shutil.rmtree(old, ignore_errors=True)
+        os.utime(root)
+    except Exception as e:
+        # The session keeps working, it just cannot be restored
+        print(f"Error saving {name} to workspace: {str(e)}")
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def save_entry_later(token, name, value):
+    """Queue save_entry on the background writer; the value must not change afterwards"""
+    return _writer.submit(save_entry, token, name, value)
+
+
+def load_entry(token, name):
+    folder = os.path.join(workspace_path(token), name)
+    try:
+        with open(os.path.join(folder, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+        with np.load(os.path.join(folder, 'arrays.npz')) as npz:
+            arrays = {key: npz[key] for key in npz.files}
+        return decode(manifest, folder, arrays)
+    except Exception as e:
+        print(f"Error loading {name} from workspace: {str(e)}")
+        return None
+
+
+def entry_version(token, name):
+    """Changes whenever the entry is saved again (0 when it does not exist)"""
+    try:
+        return os.stat(os.path.join(workspace_path(token), name)).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def load_workspace(token):
+    """Every stored entry of a workspace by name (empty for unknown tokens)"""
+    root = workspace_path(token)
+    if not os.path.isdir(root):
+        return {}
+    os.utime(root)
+    entries = {}
+    for name in sorted(os.listdir(root)):
+        if name.endswith('.tmp') or name.endswith('.old'):
+            continue
+        value = load_entry(token, name)
+        if value is not None:
+            entries[name] = value
+    return entries
+
+
+def folder_size(path):
+    total = 0
+    for folder, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(folder, name))
+            except OSError:
+                pass
+    return total
+
+
+def gc_workspaces(max_age=None, max_bytes=None, keep=()):
+    """Delete workspaces unused for max_age seconds, then the least recently
+    used ones until all fit in max_bytes. Workspaces in `keep` are spared."""
+    max_age = WORKSPACE_MAX_AGE if max_age is None else max_age
+    max_bytes = WORKSPACE_MAX_BYTES if max_bytes is None else max_bytes
+    if not os.path.isdir(WORKSPACE_DIR):
+        return
+
+    now = time.time()
+    entries = []
+    for token in os.listdir(WORKSPACE_DIR):
+        path = os.path.join(WORKSPACE_DIR, token)
+        if not os.path.isdir(path) or token in keep:
+            continue
+        mtime = os.stat(path).st_mtime
+        if now - mtime > max_age:
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            entries.append((mtime, folder_size(path), path))
+
+    total = sum(size for _, size, _ in entries)
+    total += sum(folder_size(os.path.join(WORKSPACE_DIR, token)) for token in keep
+                 if valid_token(token) and os.path.isdir(os.path.join(WORKSPACE_DIR, token)))
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size